@@ -16,7 +16,7 @@ setuptools.setup(
     author_email='rob@robbritton.com',
     url='http://github.com/robbrit/warmongo',
     keywords=["mongodb", "jsonschema"],
-    packages=['warmongo'],
+    packages=['warmongo', 'warmongo.database'],
     package_data={"warmongo": ["requirements.txt"]},
     include_package_data=True,
     install_requires=parse_requirements(),
@@ -0,0 +1,16 @@
+import warmongo
+
+MEMORY_DATABASE = "warmongo_memory_test"
+
+
+def memory_model(schema, documents=()):
+    ''' Build a model of `schema` stored in the memory backend, with an empty
+    collection holding only `documents`, inserted as they are. '''
+    warmongo.connect(MEMORY_DATABASE, backend="memory")
+    model = warmongo.model_factory(dict(schema, databaseName=MEMORY_DATABASE))
+
+    model.collection().remove({})
+    if documents:
+        model.collection().insert(list(documents))
+
+    return model
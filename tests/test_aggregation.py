@@ -0,0 +1,121 @@
+import pickle
+import unittest
+
+from warmongo.database.aggregation import run_pipeline
+from warmongo.serialization import lookup
+
+from helpers import memory_model
+
+
+class TestAggregation(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Sale',
+            'properties': {
+                'item': {'type': 'string'},
+                'quantity': {'type': 'integer'},
+                'price': {'type': 'number'},
+                'tags': {'type': 'array', 'items': {'type': 'string'}},
+            },
+        }
+
+        self.Sale = memory_model(self.schema, [
+            {"item": "pen", "quantity": 2, "price": 1.5, "tags": ["office"]},
+            {"item": "pen", "quantity": 4, "price": 1.5,
+             "tags": ["office", "school"]},
+            {"item": "ink", "quantity": 1, "price": 20.0, "tags": []},
+        ])
+
+    def testModels(self):
+        ''' Results are objects of the model by default '''
+        sales = list(self.Sale.aggregate([
+            {"$match": {"item": "pen"}},
+            {"$sort": [("quantity", -1)]},
+            {"$limit": 1},
+        ], batch_size=10, allow_disk_use=True))
+
+        self.assertEqual(1, len(sales))
+        self.assertTrue(isinstance(sales[0], self.Sale))
+        self.assertEqual(4, sales[0].quantity)
+
+    def testResultSchema(self):
+        ''' Results can be cast into a model built from a schema '''
+        schema = {
+            'name': 'ItemTotal',
+            'properties': {
+                'quantity': {'type': 'integer'},
+                'revenue': {'type': 'number'},
+                'sales': {'type': 'integer'},
+            },
+        }
+
+        totals = list(self.Sale.aggregate([
+            {"$project": {"item": 1, "quantity": 1, "price": 1}},
+            {"$group": {"_id": "$item", "quantity": {"$sum": "$quantity"},
+                        "revenue": {"$sum": "$price"},
+                        "sales": {"$sum": 1}}},
+            {"$sort": [("_id", 1)]},
+        ], output_model=schema))
+
+        self.assertEqual(["ink", "pen"], [total._id for total in totals])
+        self.assertEqual(6, totals[1].quantity)
+        self.assertEqual(2, totals[1].sales)
+        self.assertEqual(3.0, totals[1].revenue)
+
+        # the result model is only built once
+        again = next(self.Sale.aggregate([{"$limit": 1}], output_model=schema))
+        self.assertIs(type(totals[0]), type(again))
+
+    def testResultSchemaNotRegistered(self):
+        ''' A result model doesn't replace the model it is named after '''
+        schema = {
+            'name': 'Sale',
+            'properties': {
+                'quantity': {'type': 'integer'},
+            },
+        }
+
+        totals = list(self.Sale.aggregate([
+            {"$group": {"_id": "$item", "quantity": {"$sum": "$quantity"}}},
+        ], output_model=schema))
+
+        self.assertEqual(2, len(totals))
+        self.assertIs(self.Sale, lookup("Sale"))
+
+        # results can still be pickled, with their schema
+        total = pickle.loads(pickle.dumps(totals[0], 2))
+        self.assertEqual(totals[0].to_dict(), total.to_dict())
+
+    def testReadOnly(self):
+        ''' Results can be read-only records '''
+        records = list(self.Sale.aggregate([{"$match": {"item": "ink"}}],
+                                           readonly=True))
+        self.assertEqual(20.0, records[0].price)
+
+    def testPipeline(self):
+        ''' Stages work on plain documents '''
+        documents = [
+            {"_id": 1, "item": "pen", "tags": ["a", "b"], "price": 2},
+            {"_id": 2, "item": "ink", "tags": ["b"], "price": 5},
+            {"_id": 3, "item": "pen", "tags": [], "price": 4},
+        ]
+
+        results = list(run_pipeline(documents, [
+            {"$unwind": "$tags"},
+            {"$group": {"_id": {"tag": "$tags"},
+                        "items": {"$addToSet": "$item"},
+                        "average": {"$avg": "$price"},
+                        "cheapest": {"$min": "$price"},
+                        "first": {"$first": "$_id"}}},
+            {"$sort": [("_id.tag", 1)]},
+            {"$skip": 1},
+            {"$project": {"_id": 0, "tag": "$_id.tag", "items": 1,
+                          "average": 1, "cheapest": 1, "first": 1}},
+        ]))
+
+        self.assertEqual([{"tag": "b", "items": ["pen", "ink"],
+                           "average": 3.5, "cheapest": 2, "first": 1}],
+                         results)
+        self.assertEqual([{"n": 3}],
+                         list(run_pipeline(documents, [{"$count": "n"}])))
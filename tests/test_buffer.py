@@ -0,0 +1,120 @@
+import threading
+import unittest
+from bson import ObjectId
+
+import warmongo
+
+
+class FakeCollection(object):
+    ''' Records saves instead of talking to a database '''
+    def __init__(self, fail=False):
+        self.saved = []
+        self.fail = fail
+        self.written = threading.Event()
+
+    def save(self, doc, safe=True):
+        if self.fail:
+            raise IOError("write failed")
+        doc.setdefault("_id", ObjectId())
+        self.saved.append(dict(doc))
+        self.written.set()
+        return doc["_id"]
+
+
+class TestBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Counter',
+            'properties': {
+                'name': {'type': 'string'},
+                'value': {'type': 'integer'},
+            },
+            'additionalProperties': False,
+        }
+
+        self.Counter = warmongo.model_factory(self.schema)
+        self.fake = FakeCollection()
+        # overrides of collection() written before tenants still work
+        self.Counter.collection = classmethod(lambda cls: self.fake)
+
+    def tearDown(self):
+        self.Counter.stop_buffering()
+
+    def testCoalesce(self):
+        ''' Saving the same object twice only writes it once '''
+        self.Counter.buffer_writes(interval=60)
+
+        counter = self.Counter({"name": "hits", "value": 1})
+        counter.save()
+        counter.value = 2
+        counter.save()
+
+        self.assertEqual([], self.fake.saved)
+        self.assertIsNotNone(counter._id)
+
+        self.Counter.flush()
+
+        self.assertEqual([{"_id": counter._id, "name": "hits", "value": 2}],
+                         self.fake.saved)
+
+    def testSizeThreshold(self):
+        ''' A full buffer is written by the background thread '''
+        self.Counter.buffer_writes(max_size=2, interval=60)
+
+        self.Counter({"name": "a", "value": 1}).save()
+        self.Counter({"name": "b", "value": 1}).save()
+
+        self.assertTrue(self.fake.written.wait(5))
+
+    def testInterval(self):
+        ''' The buffer is written periodically '''
+        self.Counter.buffer_writes(interval=0.01)
+
+        self.Counter({"name": "a", "value": 1}).save()
+
+        self.assertTrue(self.fake.written.wait(5))
+
+    def testStopBuffering(self):
+        ''' Stopping the buffer writes what is left and saves directly '''
+        self.Counter.buffer_writes(interval=60)
+        self.Counter({"name": "a", "value": 1}).save()
+
+        self.Counter.stop_buffering()
+        self.assertEqual(1, len(self.fake.saved))
+
+        self.Counter({"name": "b", "value": 1}).save()
+        self.assertEqual(2, len(self.fake.saved))
+
+    def testErrors(self):
+        ''' Write errors go to the callback '''
+        errors = []
+        self.fake.fail = True
+        self.Counter.buffer_writes(
+            interval=60, on_error=lambda e, docs: errors.append((e, docs)))
+
+        self.Counter({"name": "a", "value": 1}).save()
+        self.Counter.flush()
+
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0][0], IOError)
+        self.assertEqual("a", errors[0][1][0]["name"])
+
+    def testFlushErrors(self):
+        ''' A failed flush keeps what wasn't written and tries every tenant '''
+        fakes = {"a": FakeCollection(fail=True), "b": FakeCollection()}
+        self.Counter.collection = classmethod(
+            lambda cls, tenant=None: fakes[tenant])
+        self.Counter.buffer_writes(interval=60)
+
+        self.Counter({"name": "a", "value": 1}, tenant="a").save()
+        self.Counter({"name": "b", "value": 1}, tenant="b").save()
+
+        self.assertRaises(IOError, self.Counter.flush)
+        self.assertEqual(["b"], [doc["name"] for doc in fakes["b"].saved])
+        self.assertEqual(1, len(self.Counter._write_buffer))
+
+        fakes["a"].fail = False
+        self.Counter.flush()
+        self.assertEqual(["a"], [doc["name"] for doc in fakes["a"].saved])
+        self.assertEqual(0, len(self.Counter._write_buffer))
@@ -76,3 +76,37 @@ class TestValidation(unittest.TestCase):
 
         self.assertEqual(5, fields["field"])
         self.assertEqual("5", fields["other_field"])
+
+    def testCastLargeArray(self):
+        schema = {
+            "name": "Model",
+            "properties": {
+                "field": {
+                    "type": "array",
+                    "items": {
+                        "type": "integer"
+                    }
+                },
+                "other_field": {
+                    "type": "array",
+                    "items": {
+                        "type": "number"
+                    }
+                }
+            }
+        }
+        Model = warmongo.model_factory(schema)
+
+        m = Model()
+
+        old_fields = {
+            "field": [float(i) for i in range(100000)] + [5],
+            "other_field": [0.5] * 100000
+        }
+
+        fields = m.cast(old_fields)
+
+        self.assertEqual(list(range(100000)) + [5], fields["field"])
+        self.assertTrue(all(isinstance(i, int) for i in fields["field"]))
+        self.assertEqual(old_fields["other_field"], fields["other_field"])
+        self.assertIsNot(old_fields["other_field"], fields["other_field"])
@@ -1,3 +1,4 @@
+import os
 import unittest
 
 import warmongo
@@ -21,8 +22,10 @@ class TestCreating(unittest.TestCase):
             'additionalProperties': False,
         }
 
-        # Connect to warmongo_test - hopefully it doesn't exist
-        warmongo.connect("warmongo_test")
+        # Connect to warmongo_test - hopefully it doesn't exist. Set
+        # WARMONGO_TEST_BACKEND=memory to run without a MongoDB server.
+        warmongo.connect("warmongo_test",
+                         backend=os.environ.get("WARMONGO_TEST_BACKEND", "mongo"))
         self.Country = warmongo.model_factory(self.schema)
 
         # Drop all the data in it
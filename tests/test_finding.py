@@ -1,6 +1,9 @@
+import os
+import time
 import unittest
 
 import warmongo
+from warmongo import model
 
 
 class TestFinding(unittest.TestCase):
@@ -21,8 +24,10 @@ class TestFinding(unittest.TestCase):
             'additionalProperties': False,
         }
 
-        # Connect to warmongo_test - hopefully it doesn't exist
-        warmongo.connect("warmongo_test")
+        # Connect to warmongo_test - hopefully it doesn't exist. Set
+        # WARMONGO_TEST_BACKEND=memory to run without a MongoDB server.
+        self.backend = os.environ.get("WARMONGO_TEST_BACKEND", "mongo")
+        warmongo.connect("warmongo_test", backend=self.backend)
         self.Country = warmongo.model_factory(self.schema)
 
         # Drop all the data in it
@@ -76,3 +81,64 @@ class TestFinding(unittest.TestCase):
 
         self.assertEqual(1, len(countries))
         self.assertEqual("Sweden", countries[0].name)
+
+    def testFindLatest(self):
+        ''' The latest object is found with a single query '''
+        self.assertEqual("United States of America",
+                         self.Country.find_latest().name)
+        self.assertEqual("Sweden",
+                         self.Country.find_latest({"abbreviation": "SE"}).name)
+        self.assertEqual(None, self.Country.find_latest({"abbreviation": "CA"}))
+
+    def testCountOptions(self):
+        ''' Counts can be estimated, hinted and cached '''
+        self.Country.collection().ensure_index("abbreviation")
+
+        self.assertEqual(2, self.Country.count(estimated=True))
+        self.assertRaises(ValueError, self.Country.count,
+                          {"abbreviation": "SE"}, estimated=True)
+        self.assertEqual(1, self.Country.count({"abbreviation": "SE"},
+                                               hint="abbreviation_1",
+                                               max_time=0.5))
+
+        self.assertEqual(2, self.Country.count({}, cache_ttl=60))
+        self.Country({"name": "Canada", "abbreviation": "CA"}).save()
+        self.assertEqual(2, self.Country.count({}, cache_ttl=60))
+        self.assertEqual(1, self.Country.count({"abbreviation": "CA"},
+                                               cache_ttl=60))
+        self.assertEqual(3, self.Country.count())
+
+        self.Country.clear_count_cache()
+        self.assertEqual(3, self.Country.count({}, cache_ttl=60))
+
+    def testCountCacheSize(self):
+        ''' Expired and excess counts are dropped '''
+        self.Country.count({"abbreviation": "A"}, cache_ttl=0.01)
+        time.sleep(0.02)
+        self.Country.count({"abbreviation": "B"}, cache_ttl=60)
+        self.assertEqual(1, len(self.Country._counts))
+
+        original = model.MAX_CACHED_COUNTS
+        model.MAX_CACHED_COUNTS = 5
+        try:
+            for i in range(10):
+                self.Country.count({"abbreviation": str(i)}, cache_ttl=60)
+        finally:
+            model.MAX_CACHED_COUNTS = original
+
+        self.assertEqual(5, len(self.Country._counts))
+
+    def testCountCacheTenants(self):
+        ''' Cached counts of one tenant aren't returned for another '''
+        Country = warmongo.model_factory(dict(
+            self.schema, tenantDatabaseName="warmongo_test_%s"))
+
+        for tenant, names in [("a", ["Chile"]), ("b", ["Peru", "Cuba"])]:
+            warmongo.connect("warmongo_test_%s" % tenant, backend=self.backend)
+            Country.collection(tenant).remove({})
+            for name in names:
+                Country({"name": name}, tenant=tenant).save()
+
+        self.assertEqual(1, Country.count({}, tenant="a", cache_ttl=60))
+        self.assertEqual(2, Country.count({}, tenant="b", cache_ttl=60))
+        self.assertEqual(2, Country.count({}, cache_ttl=60))
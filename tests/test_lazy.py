@@ -0,0 +1,122 @@
+import unittest
+from bson import BSON, ObjectId
+
+import warmongo
+from warmongo.exceptions import ValidationError
+
+from helpers import memory_model
+
+
+class TestLazy(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Country',
+            'properties': {
+                'name': {'type': 'string'},
+                'population': {'type': 'integer'},
+                'languages': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'string'
+                    }
+                }
+            },
+            'additionalProperties': False,
+        }
+
+        self.Country = warmongo.model_factory(self.schema)
+
+        self.id = ObjectId()
+        self.raw = BSON.encode({
+            "_id": self.id,
+            "name": "Sweden",
+            "population": 9.5,
+            "languages": ["swedish"]
+        })
+
+    def testFieldAccess(self):
+        ''' Fields are decoded and cast as they are accessed '''
+        sweden = self.Country.from_raw(self.raw)
+
+        self.assertEqual({}, sweden._fields)
+        self.assertEqual("Sweden", sweden.name)
+        self.assertEqual(["name"], list(sweden._fields.keys()))
+
+        self.assertEqual(9, sweden.get("population"))
+        self.assertEqual(self.id, sweden._id)
+        self.assertIsNone(sweden.get("missing"))
+
+    def testValidateOnAccess(self):
+        ''' A field is validated the first time it is read '''
+        Country = self.Country
+        broken = Country.from_raw(BSON.encode({"name": 5, "population": 7}))
+
+        self.assertEqual(7, broken.population)
+        self.assertRaises(ValidationError, getattr, broken, "name")
+
+    def testToDict(self):
+        ''' to_dict() loads the whole document '''
+        sweden = self.Country.from_raw(self.raw)
+
+        fields = sweden.to_dict()
+
+        self.assertIsNone(sweden._raw)
+        self.assertEqual(9, fields["population"])
+        self.assertEqual(["swedish"], fields["languages"])
+
+    def testMutation(self):
+        ''' Setting a field loads the rest of the document first '''
+        sweden = self.Country.from_raw(self.raw)
+
+        sweden.name = "Sverige"
+
+        self.assertIsNone(sweden._raw)
+        self.assertEqual("Sverige", sweden.name)
+        self.assertEqual(["swedish"], sweden.languages)
+
+    def testFromDict(self):
+        ''' Lazy models can also wrap decoded documents '''
+        sweden = self.Country.from_raw({"name": "Sweden", "population": 9.5})
+
+        self.assertEqual(9, sweden.population)
+        self.assertEqual({"name": "Sweden", "population": 9}, sweden.to_dict())
+
+    def testValidateOnce(self):
+        ''' Loading the rest of a lazy model validates the document once '''
+        sweden = self.Country.from_raw(self.raw)
+        checks = []
+        validate_field = self.Country.validate_field
+
+        def counting(obj, key, *args):
+            if key == "":
+                checks.append(key)
+            return validate_field(obj, key, *args)
+
+        self.Country.validate_field = counting
+        sweden.validate()
+
+        self.assertEqual(1, len(checks))
+        self.assertIsNone(sweden._raw)
+
+    def testFind(self):
+        ''' find() and find_one() return lazy models with lazy=True '''
+        Country = memory_model(self.schema, [
+            BSON(self.raw).decode(),
+            {"name": "Peru", "population": 32},
+        ])
+
+        countries = list(Country.find({}, sort=[("name", 1)], lazy=True))
+
+        self.assertEqual(["Peru", "Sweden"], [c.name for c in countries])
+        self.assertIsNotNone(countries[1]._raw)
+        self.assertEqual(9, countries[1].population)
+
+        sweden = Country.find_one({"name": "Sweden"}, lazy=True)
+        self.assertIsNotNone(sweden._raw)
+        self.assertEqual(self.id, sweden._id)
+
+        sweden.population = 10
+        sweden.save()
+        self.assertEqual(10, Country.find_one({"_id": self.id}).population)
+        self.assertIsNone(Country.find_one({"name": "Chile"}, lazy=True))
@@ -0,0 +1,209 @@
+import re
+import unittest
+from datetime import datetime
+
+import warmongo
+from warmongo.database.memory import MemoryClient
+from pymongo.errors import DuplicateKeyError
+
+from helpers import memory_model
+
+
+class TestMemoryCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = MemoryClient()["warmongo_test"]["countries"]
+
+        self.collection.insert([
+            {"name": "Sweden", "population": 9.5, "languages": ["swedish"],
+             "founded": datetime(1523, 6, 6)},
+            {"name": "Canada", "population": 35, "languages": ["english", "french"],
+             "capital": {"name": "Ottawa"}},
+            {"name": "United States", "population": 316,
+             "languages": ["english"]},
+        ])
+
+    def names(self, cursor):
+        return [doc["name"] for doc in cursor]
+
+    def testOperators(self):
+        ''' The common query operators work '''
+        find = lambda spec: sorted(self.names(self.collection.find(spec)))
+
+        self.assertEqual(["Canada"], find({"name": "Canada"}))
+        self.assertEqual(["Canada", "United States"],
+                         find({"languages": "english"}))
+        self.assertEqual(["Canada", "United States"],
+                         find({"population": {"$gt": 10}}))
+        self.assertEqual(["Canada", "Sweden"],
+                         find({"population": {"$gte": 9.5, "$lte": 35}}))
+        self.assertEqual(["Canada", "Sweden"],
+                         find({"name": {"$in": ["Sweden", "Canada", "Peru"]}}))
+        self.assertEqual(["Sweden", "United States"],
+                         find({"name": {"$ne": "Canada"}}))
+        self.assertEqual(["Canada"], find({"capital": {"$exists": True}}))
+        self.assertEqual(["Canada"], find({"capital.name": "Ottawa"}))
+        self.assertEqual(["Sweden"], find({"founded": {"$lt": datetime.now()}}))
+        self.assertEqual(["Canada", "United States"],
+                         find({"name": re.compile("^[CU]")}))
+        self.assertEqual(["Sweden"], find({"name": {"$regex": "^s", "$options": "i"}}))
+        self.assertEqual(["Canada"], find({"languages": {"$size": 2}}))
+        self.assertEqual(["Sweden", "United States"],
+                         find({"$or": [{"population": {"$lt": 10}},
+                                       {"population": {"$gt": 100}}]}))
+        # strings don't compare with numbers
+        self.assertEqual([], find({"population": {"$gt": "a"}}))
+
+    def testSortSkipLimit(self):
+        ''' Cursors sort, skip and limit '''
+        cursor = self.collection.find().sort("population", warmongo.DESCENDING)
+        self.assertEqual(["United States", "Canada", "Sweden"], self.names(cursor))
+
+        cursor = self.collection.find(sort=[("name", warmongo.ASCENDING)],
+                                      skip=1, limit=1)
+        self.assertEqual(["Sweden"], self.names(cursor))
+
+        self.assertEqual(3, self.collection.find().limit(1).count())
+        self.assertEqual(1, self.collection.find().limit(1).count(True))
+        self.assertEqual("Canada",
+                         self.collection.find().sort("name")[0]["name"])
+
+    def testCopies(self):
+        ''' Changing a result doesn't change the stored document '''
+        sweden = self.collection.find_one({"name": "Sweden"})
+        sweden["languages"].append("finnish")
+
+        self.assertEqual(["swedish"],
+                         self.collection.find_one({"name": "Sweden"})["languages"])
+
+    def testUpdate(self):
+        ''' Update operators and upserts '''
+        self.collection.update({"name": "Sweden"},
+                               {"$set": {"capital.name": "Stockholm"},
+                                "$inc": {"population": 0.5},
+                                "$push": {"languages": "finnish"}})
+
+        sweden = self.collection.find_one({"name": "Sweden"})
+        self.assertEqual("Stockholm", sweden["capital"]["name"])
+        self.assertEqual(10, sweden["population"])
+        self.assertEqual(["swedish", "finnish"], sweden["languages"])
+
+        result = self.collection.update({"languages": "english"},
+                                        {"$unset": {"population": 1}},
+                                        multi=True)
+        self.assertEqual(2, result["n"])
+        self.assertEqual(2, self.collection.find(
+            {"population": {"$exists": False}}).count())
+
+        self.collection.update({"name": "Peru"}, {"$set": {"population": 30}},
+                               upsert=True)
+        self.assertEqual(30, self.collection.find_one({"name": "Peru"})["population"])
+
+    def testSaveAndRemove(self):
+        ''' save() replaces by _id and remove() deletes matches '''
+        sweden = self.collection.find_one({"name": "Sweden"})
+        sweden["population"] = 10
+        self.collection.save(sweden)
+
+        self.assertEqual(3, self.collection.count())
+        self.assertEqual(10, self.collection.find_one(sweden["_id"])["population"])
+
+        self.collection.remove({"languages": "english"})
+        self.assertEqual(["Sweden"], self.names(self.collection.find()))
+
+    def testIndexes(self):
+        ''' Queries on indexed fields only look at matching documents '''
+        self.collection.ensure_index([("name", warmongo.HASHED)])
+        self.collection.ensure_index("population")
+
+        explain = self.collection.find({"name": "Canada"}).explain()
+        self.assertEqual("name_hashed", explain["queryPlanner"]["winningPlan"]
+                         ["inputStage"]["indexName"])
+        self.assertEqual(1, explain["executionStats"]["totalDocsExamined"])
+
+        cursor = self.collection.find({"population": {"$gt": 10, "$lt": 100}})
+        self.assertEqual(["Canada"], self.names(cursor))
+        explain = self.collection.find(
+            {"population": {"$gt": 10, "$lt": 100}}).explain()
+        self.assertEqual(1, explain["executionStats"]["totalDocsExamined"])
+
+        # indexes follow updates
+        self.collection.update({"name": "Canada"}, {"$set": {"population": 200}})
+        self.assertEqual([], self.names(self.collection.find(
+            {"population": {"$gt": 10, "$lt": 100}})))
+        self.assertEqual(["Canada"], self.names(self.collection.find(
+            {"population": 200})))
+
+        explain = self.collection.find({"languages": "english"}).explain()
+        self.assertEqual("COLLSCAN", explain["queryPlanner"]["winningPlan"]["stage"])
+
+    def testMultikeyRange(self):
+        ''' Range bounds on arrays may be met by different elements '''
+        collection = MemoryClient()["warmongo_test"]["values"]
+        collection.insert([{"a": [1, 20]}, {"a": 7}, {"a": [30]}])
+        spec = {"a": {"$gt": 5, "$lt": 10}}
+
+        scanned = sorted(map(str, (doc["a"] for doc in collection.find(spec))))
+        collection.ensure_index("a")
+        indexed = sorted(map(str, (doc["a"] for doc in collection.find(spec))))
+
+        self.assertEqual(["7", "[1, 20]"], scanned)
+        self.assertEqual(scanned, indexed)
+
+    def testUniqueIndex(self):
+        ''' Unique indexes reject duplicates '''
+        self.collection.ensure_index("name", unique=True)
+
+        self.assertRaises(DuplicateKeyError, self.collection.insert,
+                          {"name": "Sweden"})
+
+
+class TestMemoryModel(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Country',
+            'properties': {
+                'name': {'type': 'string'},
+                'population': {'type': 'integer'},
+            },
+            'indexes': [
+                {'key': 'name', 'type': 'hashed', 'unique': True},
+                'population',
+            ],
+            'additionalProperties': False,
+        }
+
+        self.Country = memory_model(self.schema, [
+            {"name": "Sweden", "population": 9},
+            {"name": "Canada", "population": 35},
+        ])
+        self.Country.ensure_indexes()
+
+    def testModel(self):
+        ''' Models work against the memory backend '''
+        self.assertEqual(2, self.Country.count())
+        self.assertEqual(1, self.Country.count({"population": {"$gt": 10}}))
+
+        canada = self.Country.find_one({"name": "Canada"})
+        self.assertEqual(35, canada.population)
+
+        canada.population = 36
+        canada.save()
+        canada.reload()
+        self.assertEqual(36, canada.population)
+
+        names = [c.name for c in self.Country.find(sort="name")]
+        self.assertEqual(["Canada", "Sweden"], names)
+
+        canada.delete()
+        self.assertEqual(1, self.Country.count())
+
+    def testIndexes(self):
+        ''' Indexes come from the schema '''
+        information = self.Country.collection().index_information()
+
+        self.assertIn("name_hashed", information)
+        self.assertIn("population_1", information)
+        self.assertRaises(DuplicateKeyError,
+                          self.Country({"name": "Sweden"}).save)
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from copy import deepcopy
+
+import warmongo
+from warmongo.migration import partition_bounds
+
+from helpers import memory_model
+
+
+def add_region(document):
+    document["region"] = "north" if document["population"] < 20 else "south"
+    document["population"] = document["population"] * 1.0
+    return document
+
+
+class TestMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'City',
+            'properties': {
+                'name': {'type': 'string'},
+                'population': {'type': 'integer'},
+                'region': {'type': 'string'},
+            },
+        }
+
+        self.City = memory_model(self.schema, [
+            {"name": "city%d" % i, "population": i} for i in range(40)
+        ])
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testBounds(self):
+        ''' Partitions split the collection evenly by _id '''
+        bounds = partition_bounds(self.City.collection(), {}, 4)
+        collection = self.City.collection()
+
+        self.assertEqual(5, len(bounds))
+        self.assertEqual(10, collection.find({"_id": {"$gte": bounds[1],
+                                                      "$lt": bounds[2]}}).count())
+
+    def testMigrate(self):
+        ''' Every document is transformed, cast and saved '''
+        result = self.City.migrate(add_region, 1, processes=0,
+                                   batch_size=7, checkpoint_dir=self.directory)
+
+        self.assertEqual({"migrated": 40, "skipped": 0}, result)
+        self.assertEqual(20, self.City.count({"region": "north"}))
+
+        city = self.City.find_one({"name": "city3"})
+        self.assertEqual(3, city.population)
+        self.assertTrue(isinstance(city.population, int))
+
+        # a finished migration does nothing
+        result = self.City.migrate(add_region, 1, processes=0,
+                                   checkpoint_dir=self.directory)
+        self.assertEqual(40, result["migrated"])
+
+    def testResume(self):
+        ''' A migration that fails picks up where it stopped '''
+        calls = []
+
+        def failing(document):
+            calls.append(document["name"])
+            if document["name"] == "city25":
+                raise RuntimeError("crash")
+            return add_region(document)
+
+        self.assertRaises(RuntimeError, self.City.migrate, failing, 2,
+                          processes=0, partitions=2, batch_size=2,
+                          checkpoint_dir=self.directory)
+        self.assertEqual(24, self.City.count({"region": {"$exists": True}}))
+
+        del calls[:]
+
+        def counting(document):
+            calls.append(document["name"])
+            return add_region(document)
+
+        result = self.City.migrate(counting, 2, processes=0, partitions=2,
+                                   batch_size=2, checkpoint_dir=self.directory)
+
+        # only the documents after the last checkpoint are done again
+        self.assertEqual(16, len(calls))
+        self.assertEqual(40, result["migrated"])
+        self.assertEqual(40, self.City.count({"region": {"$exists": True}}))
+
+    def testSkip(self):
+        ''' Documents the transform returns None for are left alone '''
+        def north(document):
+            if document["population"] < 20:
+                return add_region(document)
+            return None
+
+        result = self.City.migrate(north, 3, processes=0,
+                                   checkpoint_dir=self.directory)
+
+        self.assertEqual({"migrated": 20, "skipped": 20}, result)
+
+    def testRate(self):
+        ''' Writes are throttled to max_rate '''
+        start = time.time()
+        self.City.migrate(add_region, 4, processes=0, batch_size=10,
+                          max_rate=200, checkpoint_dir=self.directory)
+
+        self.assertGreaterEqual(time.time() - start, 0.15)
+        self.assertTrue(os.path.exists(os.path.join(self.directory,
+                                                    "cities.v4.json")))
+
+    def testVersionField(self):
+        ''' Stamped documents aren't transformed again after a crash '''
+        # same collection, with a field for the version
+        schema = deepcopy(self.City._schema)
+        schema["properties"]["schemaVersion"] = {"type": "integer"}
+        City = warmongo.model_factory(schema)
+        calls = []
+        crash = [True]
+
+        def doubling(document):
+            calls.append(document["name"])
+            if document["name"] == "city25" and crash[0]:
+                raise RuntimeError("crash")
+            document["population"] *= 2
+            return document
+
+        self.assertRaises(RuntimeError, City.migrate, doubling, 5,
+                          processes=0, partitions=1, batch_size=10,
+                          checkpoint_dir=self.directory,
+                          version_field="schemaVersion")
+
+        # lose the checkpoints, as if the crash came right after a write
+        shutil.rmtree(self.directory)
+        os.mkdir(self.directory)
+        del calls[:]
+        crash[0] = False
+
+        result = City.migrate(doubling, 5, processes=0, partitions=1,
+                              checkpoint_dir=self.directory,
+                              version_field="schemaVersion")
+
+        self.assertEqual(20, len(calls))
+        self.assertEqual(20, result["migrated"])
+        self.assertEqual(60, City.find_one({"name": "city30"}).population)
+        self.assertEqual(10, City.find_one({"name": "city5"}).population)
+        self.assertEqual(40, City.count({"schemaVersion": 5}))
+
+    def testProcesses(self):
+        ''' Worker processes can't see the memory backend '''
+        self.assertRaises(ValueError, self.City.migrate, add_region, 6,
+                          checkpoint_dir=self.directory)
+        self.assertRaises(ValueError, self.City.migrate, add_region, 6,
+                          processes=2, checkpoint_dir=self.directory)
+        self.assertEqual([], os.listdir(self.directory))
@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+
+from warmongo.prefetch import prefetched
+
+from helpers import memory_model
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def testOrder(self):
+        ''' Everything comes back in order '''
+        results = prefetched(iter(range(250)), 2, batch_size=100)
+
+        self.assertEqual(range(250), list(results))
+
+    def testBackgroundThread(self):
+        ''' The results are produced on another thread '''
+        threads = set()
+
+        def produce():
+            for i in range(10):
+                threads.add(threading.current_thread())
+                yield i
+
+        self.assertEqual(range(10), list(prefetched(produce(), 1, 3)))
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def testException(self):
+        ''' Errors on the background thread are raised in the consumer '''
+        def produce():
+            yield 1
+            raise KeyError("broken")
+
+        results = prefetched(produce(), 1, 1)
+
+        self.assertEqual(1, next(results))
+        self.assertRaises(KeyError, list, results)
+
+    def testClose(self):
+        ''' Closing the results early stops the background thread '''
+        closed = threading.Event()
+
+        def produce():
+            try:
+                i = 0
+                while True:
+                    yield i
+                    i += 1
+            finally:
+                closed.set()
+
+        results = prefetched(produce(), 2, 10)
+
+        self.assertEqual(0, next(results))
+        results.close()
+
+        self.assertTrue(closed.wait(5))
+
+    def testFind(self):
+        ''' find() prefetches models with prefetch=N '''
+        Country = memory_model({
+            'name': 'Country',
+            'properties': {
+                'name': {'type': 'string'},
+                'population': {'type': 'integer'},
+            },
+        }, [{"name": "country%02d" % i, "population": i} for i in range(25)])
+
+        countries = list(Country.find({}, sort=[("name", 1)], prefetch=2,
+                                      batch_size=4))
+
+        self.assertEqual(["country%02d" % i for i in range(25)],
+                         [country.name for country in countries])
+        self.assertTrue(isinstance(countries[0], Country))
+
+        # stopping early leaves no thread behind
+        threads = threading.active_count()
+        for country in Country.find({}, prefetch=1, batch_size=2):
+            break
+        deadline = time.time() + 5
+        while threading.active_count() > threads and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(threads, threading.active_count())
@@ -0,0 +1,110 @@
+import unittest
+
+from warmongo.profiler import QueryProfiler, query_shape, summarize_explain
+
+from helpers import memory_model
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Country',
+            'properties': {
+                'name': {'type': 'string'},
+                'population': {'type': 'integer'},
+            },
+            'indexes': ['name'],
+        }
+
+        self.Country = memory_model(self.schema, [
+            {"name": name, "population": 10}
+            for name in ["Sweden", "Canada", "Peru"]
+        ])
+        self.Country.ensure_indexes()
+
+    def testShape(self):
+        ''' Shapes keep fields and operators but not values '''
+        self.assertEqual({"name": "?", "population": {"$gt": "?"}},
+                         query_shape({"name": "Peru", "population": {"$gt": 5}}))
+        self.assertEqual({"$or": [{"a": "?"}, {"b": {"$in": ["?"]}}]},
+                         query_shape({"$or": [{"a": 1}, {"b": {"$in": [1, 2]}}]}))
+
+    def testRecord(self):
+        ''' Queries through models are recorded '''
+        with QueryProfiler("test") as profiler:
+            list(self.Country.find({"population": 10}, sort=[("name", 1)]))
+            self.Country.find_one({"name": "Peru"})
+            self.Country.find_by_id(self.Country.find_one()._id)
+            self.Country.count({"name": "Peru"})
+
+        # nothing is recorded outside the scope
+        self.Country.find_one({"name": "Peru"})
+
+        operations = sorted(stats["operation"] for stats in profiler.summary())
+        self.assertEqual(["count", "find", "find_one", "find_one", "find_one"],
+                         operations)
+        self.assertEqual([], profiler.slow_queries)
+        self.assertIn("5 run", profiler.report())
+
+    def testNPlusOne(self):
+        ''' Repeated queries of the same shape are flagged '''
+        with QueryProfiler("test", repeats=3) as profiler:
+            for name in ["Sweden", "Canada", "Peru"]:
+                self.Country.find_one({"name": name})
+            self.Country.find_one({"population": 10})
+
+        flagged = profiler.n_plus_one()
+        self.assertEqual(1, len(flagged))
+        self.assertEqual('{"name": "?"}', flagged[0]["shape"])
+        self.assertEqual(3, flagged[0]["count"])
+        self.assertIn("N+1", profiler.report())
+
+    def testSlowQuery(self):
+        ''' Slow queries are kept with their explain summary '''
+        with QueryProfiler("test", slow=0) as profiler:
+            self.Country.find_one({"name": "Peru"})
+
+        slow = profiler.slow_queries[0]
+        self.assertEqual("find_one", slow["operation"])
+        self.assertEqual("name_1", slow["explain"]["index"])
+        self.assertEqual(1, slow["explain"]["docs_examined"])
+
+    def testLegacyExplain(self):
+        ''' Old style explain output is understood too '''
+        summary = summarize_explain({"cursor": "BtreeCursor name_1",
+                                     "nscanned": 4, "nscannedObjects": 4,
+                                     "n": 1})
+
+        self.assertEqual({"index": "name_1", "keys_examined": 4,
+                          "docs_examined": 4, "returned": 1}, summary)
+
+    def testCursorMethods(self):
+        ''' Profiled cursors only have the methods of the driver's cursor '''
+        class OldCursor(object):
+            def limit(self, limit):
+                return self
+
+        with QueryProfiler("test") as profiler:
+            collection = profiler.wrap(self.Country.collection(), self.Country)
+            cursor = collection.find({"name": "Peru"})
+            cursor._cursor = OldCursor()
+
+            self.assertFalse(hasattr(cursor, "max_time_ms"))
+            self.assertIs(cursor, cursor.limit(1))
+
+    def testClose(self):
+        ''' Cursors are recorded when closed, never when garbage collected '''
+        with QueryProfiler("test", slow=0) as profiler:
+            self.Country.find_latest({"population": 10})
+            for country in self.Country.find({"population": 10}):
+                break
+
+            collection = profiler.wrap(self.Country.collection(), self.Country)
+            cursor = collection.find({"name": "Peru"})
+            next(cursor)
+            del cursor
+
+        self.assertEqual(2, len(profiler.slow_queries))
+        self.assertEqual(["find", "find"], [slow["operation"]
+                                            for slow in profiler.slow_queries])
@@ -0,0 +1,93 @@
+import unittest
+from bson import ObjectId
+
+import warmongo
+from warmongo.exceptions import ReadOnlyException
+from warmongo.record import record_class
+
+from helpers import memory_model
+
+
+class TestReadOnly(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Country',
+            'properties': {
+                'name': {'type': 'string'},
+                'population': {'type': 'integer'},
+                'count': {'type': 'integer'},
+                'languages': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'string'
+                    }
+                }
+            },
+            'additionalProperties': False,
+        }
+
+        self.Country = warmongo.model_factory(self.schema)
+        self.Record = record_class(self.Country)
+
+        self.id = ObjectId()
+        self.document = {
+            "_id": self.id,
+            "name": "Sweden",
+            "population": 9.5,
+            "count": 3,
+        }
+
+    def testAttributes(self):
+        ''' Fields are readable by property name and cast '''
+        sweden = self.Record.from_document(self.document)
+
+        self.assertEqual(self.id, sweden._id)
+        self.assertEqual("Sweden", sweden.name)
+        self.assertEqual(9, sweden.population)
+        self.assertEqual(3, sweden.count)
+        self.assertRaises(AttributeError, getattr, sweden, "languages")
+        self.assertEqual([], sweden.get("languages", []))
+
+    def testCachedClass(self):
+        ''' The record class is only built once per model '''
+        self.assertIs(self.Record, record_class(self.Country))
+        self.assertFalse(hasattr(self.Record.from_document({}), "__dict__"))
+
+    def testImmutable(self):
+        ''' Records can't be changed or saved '''
+        sweden = self.Record.from_document(self.document)
+
+        self.assertRaises(ReadOnlyException, setattr, sweden, "name", "Sverige")
+        self.assertRaises(ReadOnlyException, setattr, sweden, "other", 5)
+        self.assertRaises(ReadOnlyException, sweden.save)
+        self.assertRaises(ReadOnlyException, sweden.delete)
+
+    def testToDict(self):
+        ''' to_dict() only contains the fields that were found '''
+        sweden = self.Record.from_document(self.document)
+
+        self.assertEqual({
+            "_id": self.id,
+            "name": "Sweden",
+            "population": 9,
+            "count": 3,
+        }, sweden.to_dict())
+
+    def testFind(self):
+        ''' find() returns records with readonly=True '''
+        Country = memory_model(self.schema, [
+            self.document,
+            {"name": "Peru", "population": 32},
+        ])
+
+        countries = list(Country.find({}, sort=[("name", 1)], readonly=True))
+
+        self.assertEqual(["Peru", "Sweden"], [c.name for c in countries])
+        self.assertIs(record_class(Country), type(countries[1]))
+        self.assertEqual(9, countries[1].population)
+        self.assertRaises(ReadOnlyException, countries[0].save)
+
+        batched = list(Country.find({"population": {"$gt": 5}}, batch_size=1,
+                                    readonly=True))
+        self.assertEqual(2, len(batched))
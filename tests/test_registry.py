@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from warmongo.registry import SchemaRegistry, read_json, write_json
+from warmongo.exceptions import UnknownModelException, ValidationError
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, "cache")
+
+        self.write("country.json", {
+            "name": "Country",
+            "properties": {
+                "name": {"type": "string"},
+                "population": {"type": "integer", "minimum": 0},
+            },
+        })
+        self.write("city.json", {
+            "name": "City",
+            "properties": {"name": {"type": "string"}},
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, filename, schema):
+        with open(os.path.join(self.directory, filename), "w") as f:
+            json.dump(schema, f)
+
+    def testLazy(self):
+        ''' Models are built the first time they are asked for '''
+        registry = SchemaRegistry(self.directory)
+
+        self.assertEqual(["City", "Country"], registry.names())
+        self.assertEqual({}, registry._models)
+
+        Country = registry.Country
+        self.assertIs(Country, registry["Country"])
+        self.assertEqual(["Country"], list(registry._models))
+
+        self.assertEqual("countries", Country.collection_name())
+        self.assertEqual(5, Country({"population": 5}).population)
+        self.assertRaises(ValidationError, Country, {"population": -1})
+        self.assertRaises(UnknownModelException, registry.get, "Planet")
+
+    def testCache(self):
+        ''' Model files and collection names are cached in one index '''
+        registry = SchemaRegistry(self.directory, cache_dir=self.cache_dir)
+        self.assertEqual("countries", registry.Country.collection_name())
+        self.assertEqual(["index.json"], os.listdir(self.cache_dir))
+
+        # a new process reuses the cached collection name
+        registry = SchemaRegistry(self.directory, cache_dir=self.cache_dir)
+        self.assertEqual(["City", "Country"], registry.names())
+        Country = registry.Country
+        self.assertEqual("countries", Country.__dict__["_collection_name"])
+        self.assertIn("_id", Country._schema["properties"])
+        self.assertRaises(ValidationError, Country, {"population": -1})
+
+    def testChanged(self):
+        ''' Changing a schema file invalidates its cache '''
+        SchemaRegistry(self.directory, cache_dir=self.cache_dir).preload()
+
+        self.write("country.json", {
+            "name": "Country",
+            "collectionName": "nations",
+            "properties": {"name": {"type": "string"}},
+        })
+        os.utime(os.path.join(self.directory, "country.json"), (0, 0))
+
+        registry = SchemaRegistry(self.directory, cache_dir=self.cache_dir)
+        self.assertEqual("nations", registry.Country.collection_name())
+
+    def testConcurrentWrites(self):
+        ''' Writers of the same file don't share a temporary file '''
+        path = os.path.join(self.directory, "shared.json")
+        threads = [threading.Thread(target=write_json, args=(path, {
+            "writer": i,
+            "data": [i] * 1000,
+        })) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        data = read_json(path)
+        self.assertEqual([data["writer"]] * 1000, data["data"])
+        self.assertEqual([], [name for name in os.listdir(self.directory)
+                              if name.endswith(".tmp")])
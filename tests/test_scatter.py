@@ -0,0 +1,114 @@
+import threading
+import unittest
+
+import warmongo
+from warmongo.scatter import scatter, sort_documents
+
+from helpers import memory_model
+
+
+class TestScatter(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Report',
+            'tenantDatabaseName': 'reports_%s',
+            'properties': {
+                'name': {'type': 'string'},
+            },
+        }
+
+        self.Report = warmongo.model_factory(self.schema)
+
+    def testRoute(self):
+        ''' Tenants are routed with the schema's format string '''
+        self.assertEqual("reports_acme", self.Report.route("acme"))
+
+        Other = warmongo.model_factory({
+            "name": "Other",
+            "databaseName": "other",
+            "properties": {"name": {"type": "string"}}
+        })
+        self.assertEqual("other", Other.route("acme"))
+
+    def testTenant(self):
+        ''' Objects remember which tenant they belong to '''
+        report = self.Report({"name": "daily"}, tenant="acme")
+
+        self.assertEqual("acme", report._tenant)
+        self.assertIsNone(self.Report({"name": "daily"})._tenant)
+
+    def testScatter(self):
+        ''' Work runs on several threads and comes back in order '''
+        threads = set()
+
+        def work(item):
+            threads.add(threading.current_thread())
+            return item * 2
+
+        self.assertEqual([2, 4, 6, 8], scatter(work, [1, 2, 3, 4], workers=4))
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertEqual([], scatter(work, []))
+
+    def testSortDocuments(self):
+        ''' Merged results follow the sort specification '''
+        documents = [
+            {"name": "b", "stats": {"visits": 1}},
+            {"name": "a", "stats": {"visits": 1}},
+            {"name": "c", "stats": {"visits": 5}},
+        ]
+
+        result = sort_documents(documents, [("stats.visits", warmongo.DESCENDING),
+                                            ("name", warmongo.ASCENDING)])
+
+        self.assertEqual(["c", "a", "b"], [doc["name"] for doc in result])
+        self.assertEqual(["a", "b", "c"],
+                         [doc["name"] for doc in sort_documents(documents, "name")])
+
+
+class TestScatterModel(unittest.TestCase):
+
+    def setUp(self):
+        self.tenants = ["a", "b", "c"]
+        self.Report = memory_model({
+            'name': 'Report',
+            'tenantDatabaseName': 'warmongo_memory_test_%s',
+            'properties': {
+                'name': {'type': 'string'},
+                'visits': {'type': 'integer'},
+            },
+        })
+
+        for i, tenant in enumerate(self.tenants):
+            warmongo.connect("warmongo_memory_test_%s" % tenant,
+                             backend="memory")
+            collection = self.Report.collection(tenant)
+            collection.remove({})
+            collection.insert([{"name": "%s%d" % (tenant, j),
+                                "visits": j * 3 + i}
+                               for j in range(i + 1)])
+
+    def testScatterFind(self):
+        ''' Results of every tenant are merged, then skipped and limited '''
+        reports = self.Report.scatter_find(self.tenants, {},
+                                           sort=[("visits", warmongo.ASCENDING)],
+                                           skip=1, limit=3)
+
+        self.assertEqual(["b0", "c0", "b1"], [r.name for r in reports])
+        self.assertEqual(["b", "c", "b"], [r._tenant for r in reports])
+
+        reports = self.Report.scatter_find(self.tenants,
+                                           {"visits": {"$gte": 3}})
+        self.assertEqual(set(["b1", "c1", "c2"]),
+                         set(r.name for r in reports))
+
+    def testScatterCount(self):
+        ''' Counts are summed, or kept apart by tenant '''
+        self.assertEqual(6, self.Report.scatter_count(self.tenants))
+        self.assertEqual({"a": 1, "b": 2, "c": 3},
+                         self.Report.scatter_count(self.tenants,
+                                                   by_tenant=True))
+        self.assertEqual({"a": 0, "b": 1, "c": 2},
+                         self.Report.scatter_count(self.tenants,
+                                                   {"visits": {"$gte": 3}},
+                                                   by_tenant=True))
@@ -0,0 +1,105 @@
+import pickle
+import unittest
+from datetime import datetime
+
+import warmongo
+from warmongo import serialization
+from warmongo.exceptions import UnknownModelException, ValidationError
+
+
+class TestSerialization(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Shipment',
+            'properties': {
+                'code': {'type': 'string'},
+                'weight': {'type': 'integer'},
+                'sent': {'type': 'date'},
+            },
+        }
+
+        self.Shipment = warmongo.model_factory(self.schema)
+        self.shipment = self.Shipment({"code": "A1", "weight": 5,
+                                       "sent": datetime(2013, 1, 1)},
+                                      tenant="acme")
+
+    def testPickle(self):
+        ''' Objects are pickled by model name, without the schema '''
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            data = pickle.dumps(self.shipment, protocol)
+            self.assertNotIn("properties", data)
+
+            shipment = pickle.loads(data)
+            self.assertIs(self.Shipment, type(shipment))
+            self.assertEqual(self.shipment.to_dict(), shipment.to_dict())
+            self.assertEqual("acme", shipment._tenant)
+
+    def testNoValidation(self):
+        ''' Restored objects are not validated again '''
+        data = pickle.dumps(self.shipment, 2)
+
+        self.Shipment.validate = lambda obj: self.fail("validated")
+        self.assertEqual(5, pickle.loads(data).weight)
+
+    def testLazy(self):
+        ''' Lazy models are loaded before pickling '''
+        shipment = self.Shipment.from_raw(self.shipment.to_dict())
+        self.assertEqual("A1", pickle.loads(pickle.dumps(shipment, 2)).code)
+
+    def testLazyValidation(self):
+        ''' Fields of lazy models that were never read are validated too '''
+        shipment = self.Shipment.from_raw({"weight": 1, "code": 5})
+        self.assertEqual(1, shipment.weight)
+
+        self.assertRaises(ValidationError, pickle.dumps, shipment, 2)
+
+        shipment = self.Shipment.from_raw({"weight": 1, "code": 5})
+        self.assertRaises(ValidationError, serialization.dumps, shipment)
+
+    def testBSON(self):
+        ''' Objects can be encoded as BSON '''
+        shipment = serialization.loads(serialization.dumps(self.shipment))
+
+        self.assertIs(self.Shipment, type(shipment))
+        self.assertEqual("A1", shipment.code)
+        self.assertEqual(datetime(2013, 1, 1), shipment.sent)
+        self.assertEqual("acme", shipment._tenant)
+
+    def testUnknownModel(self):
+        ''' Restoring objects of models that aren't registered fails '''
+        data = serialization.dumps(self.shipment)
+        del serialization.models["Shipment"]
+
+        self.assertRaises(UnknownModelException, serialization.loads, data)
+        self.assertRaises(UnknownModelException, serialization.dumps,
+                          self.shipment)
+
+    def testShadowedModel(self):
+        ''' Objects of a model replaced by another of its name keep theirs '''
+        Shadowed = self.Shipment
+        self.Shipment = warmongo.model_factory(self.schema)
+
+        shipment = pickle.loads(pickle.dumps(self.shipment, 2))
+
+        self.assertIsNot(self.Shipment, type(shipment))
+        self.assertEqual(Shadowed._schema, type(shipment)._schema)
+        self.assertEqual(self.shipment.to_dict(), shipment.to_dict())
+        self.assertEqual("acme", shipment._tenant)
+
+        # the model is only built once
+        again = pickle.loads(pickle.dumps(self.shipment, 2))
+        self.assertIs(type(shipment), type(again))
+        self.assertIs(self.Shipment, serialization.lookup("Shipment"))
+
+    def testResultModel(self):
+        ''' Objects of unregistered models, like aggregation results, pickle '''
+        Total = warmongo.model_factory({
+            'name': 'Total',
+            'properties': {'quantity': {'type': 'integer'}},
+        }, register=False)
+
+        total = pickle.loads(pickle.dumps(Total({"quantity": 3}), 2))
+
+        self.assertEqual(3, total.quantity)
+        self.assertNotIn("Total", serialization.models)
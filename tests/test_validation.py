@@ -3,7 +3,7 @@ from datetime import datetime
 from bson import ObjectId
 
 import warmongo
-from warmongo.exceptions import ValidationError
+from warmongo.exceptions import ValidationError, InvalidSchemaException
 
 
 class TestValidation(unittest.TestCase):
@@ -242,3 +242,156 @@ class TestValidation(unittest.TestCase):
         self.assertRaises(ValidationError, Model, {
             "field": "hi"
         })
+
+    def testValidateBounds(self):
+        schema = {
+            "name": "Model",
+            "properties": {
+                "field": {
+                    "type": "integer",
+                    "minimum": 0,
+                    "maximum": 10,
+                    "exclusiveMaximum": True
+                },
+                "ratio": {
+                    "type": "number",
+                    "exclusiveMinimum": 0
+                }
+            }
+        }
+
+        Model = warmongo.model_factory(schema)
+
+        m = Model({
+            "field": 0,
+            "ratio": 0.5
+        })
+
+        self.assertEqual(0, m.field)
+        self.assertRaises(ValidationError, Model, {"field": -1})
+        self.assertRaises(ValidationError, Model, {"field": 10})
+        self.assertRaises(ValidationError, Model, {"ratio": 0})
+
+    def testValidatePattern(self):
+        schema = {
+            "name": "Model",
+            "properties": {
+                "field": {
+                    "type": "string",
+                    "pattern": "^[a-z]+$",
+                    "minLength": 2,
+                    "maxLength": 4
+                }
+            }
+        }
+
+        Model = warmongo.model_factory(schema)
+
+        m = Model({
+            "field": "asdf"
+        })
+
+        self.assertEqual("asdf", m.field)
+        self.assertRaises(ValidationError, Model, {"field": "ASDF"})
+        self.assertRaises(ValidationError, Model, {"field": "a"})
+        self.assertRaises(ValidationError, Model, {"field": "asdfg"})
+
+        schema["properties"]["field"]["pattern"] = "(unclosed"
+        self.assertRaises(InvalidSchemaException, warmongo.model_factory, schema)
+
+    def testValidateEnum(self):
+        schema = {
+            "name": "Model",
+            "properties": {
+                "field": {
+                    "type": "string",
+                    "enum": ["red", "green"]
+                }
+            }
+        }
+
+        Model = warmongo.model_factory(schema)
+
+        m = Model({
+            "field": "red"
+        })
+
+        self.assertEqual("red", m.field)
+        self.assertRaises(ValidationError, Model, {"field": "blue"})
+        self.assertRaises(ValidationError, setattr, m, "field", "blue")
+
+    def testValidateItems(self):
+        schema = {
+            "name": "Model",
+            "properties": {
+                "field": {
+                    "type": "array",
+                    "items": {
+                        "type": "integer",
+                        "minimum": 0
+                    },
+                    "minItems": 1,
+                    "maxItems": 3,
+                    "uniqueItems": True
+                }
+            }
+        }
+
+        Model = warmongo.model_factory(schema)
+
+        m = Model({
+            "field": [1, 2]
+        })
+
+        self.assertEqual([1, 2], m.field)
+        self.assertRaises(ValidationError, Model, {"field": []})
+        self.assertRaises(ValidationError, Model, {"field": [1, 2, 3, 4]})
+        self.assertRaises(ValidationError, Model, {"field": [1, 1]})
+        self.assertRaises(ValidationError, Model, {"field": [-1]})
+
+    def testValidateLargeArray(self):
+        schema = {
+            "name": "Model",
+            "properties": {
+                "field": {
+                    "type": "array",
+                    "items": {
+                        "type": ["number", "null"],
+                        "maximum": 100000
+                    }
+                }
+            }
+        }
+
+        Model = warmongo.model_factory(schema)
+
+        values = [float(i) for i in range(100000)] + [None, 5]
+        m = Model({
+            "field": values
+        })
+
+        self.assertEqual(values, m.field)
+        self.assertRaises(ValidationError, Model, {"field": values + ["hi"]})
+        self.assertRaises(ValidationError, Model, {"field": values + [100001]})
+
+    def testConstraintsOwnedByModel(self):
+        schema = {
+            "name": "Model",
+            "properties": {
+                "field": {
+                    "type": "integer",
+                    "maximum": 10
+                }
+            }
+        }
+
+        Model = warmongo.model_factory(schema)
+        field = Model._schema["properties"]["field"]
+
+        self.assertTrue(Model._constraints[id(field)][0] is field)
+        self.assertFalse(hasattr(warmongo.constraints, "compiled"))
+
+        # a schema that isn't the model's is compiled when it's used
+        m = Model({"field": 5})
+        self.assertRaises(ValidationError, m.validate_field, "other",
+                          {"type": "integer", "minimum": 0}, -1)
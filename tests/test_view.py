@@ -0,0 +1,76 @@
+import time
+import unittest
+
+from warmongo.view import MaterializedView
+
+from helpers import memory_model
+
+
+class TestView(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = {
+            'name': 'Tier',
+            'properties': {
+                'name': {'type': 'string'},
+                'price': {'type': 'integer'},
+                'active': {'type': 'boolean'},
+            },
+            'indexes': ['price'],
+        }
+
+        self.Tier = memory_model(self.schema, [
+            {"name": "free", "price": 0, "active": True},
+            {"name": "pro", "price": 10, "active": True},
+            {"name": "legacy", "price": 5, "active": False},
+        ])
+
+    def wait_for(self, check):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            if check():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def testFind(self):
+        ''' Reads are answered from the loaded documents '''
+        with self.Tier.materialize({"active": True}, interval=60) as view:
+            self.assertEqual(2, view.count())
+            self.assertEqual(["free", "pro"],
+                             [t.name for t in view.find(sort="price")])
+            self.assertEqual("pro", view.find_one({"price": {"$gt": 5}}).name)
+            self.assertEqual(10, view.find_one({"name": "pro"}, readonly=True).price)
+
+            # the database isn't asked again
+            self.Tier({"name": "team", "price": 20, "active": True}).save()
+            self.assertEqual(2, view.count())
+
+    def testPolling(self):
+        ''' Without change streams the view reloads periodically '''
+        with self.Tier.materialize({"active": True}, interval=0.01) as view:
+            self.Tier({"name": "team", "price": 20, "active": True}).save()
+
+            self.assertTrue(self.wait_for(lambda: view.count() == 3))
+
+            self.Tier.collection().remove({"name": "free"})
+            self.assertTrue(self.wait_for(lambda: view.count() == 2))
+
+    def testApplyChanges(self):
+        ''' Change stream events update the view '''
+        view = MaterializedView(self.Tier, {"active": True})
+        view.refresh()
+
+        team = {"_id": 1, "name": "team", "price": 20, "active": True}
+        view.apply({"operationType": "insert", "documentKey": {"_id": 1},
+                    "fullDocument": team})
+        self.assertEqual(3, view.count())
+
+        team["active"] = False
+        view.apply({"operationType": "update", "documentKey": {"_id": 1},
+                    "fullDocument": team})
+        self.assertEqual(2, view.count())
+
+        pro = view.find_one({"name": "pro"})
+        view.apply({"operationType": "delete", "documentKey": {"_id": pro._id}})
+        self.assertEqual(["free"], [t.name for t in view.find()])
@@ -14,6 +14,8 @@
 
 from model import Model as WarmongoModel
 from exceptions import InvalidSchemaException
+from constraints import compile_schema
+from serialization import register as register_model
 
 from copy import deepcopy
 import database
@@ -25,24 +27,35 @@ connect = database.connect
 # Export some constants from pymongo
 ASCENDING = pymongo.ASCENDING
 DESCENDING = pymongo.DESCENDING
+HASHED = pymongo.HASHED
 
 
-def model_factory(schema, base_class=WarmongoModel):
-    ''' Construct a model based on `schema` that inherits from `base_class`. '''
+def model_factory(schema, base_class=WarmongoModel, copy=True, register=True):
+    ''' Construct a model based on `schema` that inherits from `base_class`.
+    Pass copy=False to use `schema` as it is instead of a copy, if nothing
+    else holds on to it. Pass register=False to keep the model out of the
+    serialization registry, so that it doesn't take the place of another
+    model with the same name; its objects are then pickled with their schema.
+    '''
     if not schema.get("properties"):
         raise InvalidSchemaException("No properties field in schema!")
 
     if not schema.get("name"):
         raise InvalidSchemaException("Warmongo models require a top-level 'name' attribute!")
 
-    schema = deepcopy(schema)
+    if copy:
+        schema = deepcopy(schema)
 
     # All models have an _id field
     if not "_id" in schema["properties"]:
         schema["properties"]["_id"] = {"type": "object_id"}
 
+    # Compile regexes, enums, etc. once instead of on every validation
+    constraints = compile_schema(schema)
+
     class Model(base_class):
         _schema = schema
+        _constraints = constraints
 
         def __init__(self, *args, **kwargs):
             self._schema = schema
@@ -50,4 +63,8 @@ def model_factory(schema, base_class=WarmongoModel):
 
     Model.__name__ = str(schema["name"])
 
+    # so pickled objects can find their model again
+    if register:
+        register_model(Model)
+
     return Model
@@ -0,0 +1,140 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Write-behind buffering of saves. '''
+import atexit
+import logging
+import sys
+import threading
+
+from collections import OrderedDict
+
+from bson import ObjectId
+
+import database
+
+logger = logging.getLogger("warmongo")
+
+
+class WriteBuffer(object):
+    ''' Collects saves of a model and writes them in bulk from a background
+    thread. Saving the same document more than once before a flush only
+    writes its latest version.
+
+    The buffer is flushed when it holds `max_size` documents, every `interval`
+    seconds, when flush() is called and when the process exits. If a write
+    fails, `on_error` is called with the exception and the documents that were
+    not written. Without it the error is logged, or, for explicit calls to
+    flush(), the documents that weren't written are queued again and the
+    first error is raised once every tenant has been tried. '''
+
+    def __init__(self, model, max_size=1000, interval=1.0, on_error=None):
+        self.model = model
+        self.max_size = max_size
+        self.interval = interval
+        self.on_error = on_error
+
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        # only one flush writes at a time so older versions of a document
+        # can't overwrite newer ones
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run,
+                                        name="warmongo-write-buffer")
+        self._worker.daemon = True
+        self._worker.start()
+
+        atexit.register(self.close)
+
+    def add(self, obj):
+        ''' Queue `obj` to be saved. Objects without an _id get one so that
+        later saves of the same object replace this one. '''
+        fields = obj.to_dict()
+
+        if fields.get("_id") is None:
+            fields["_id"] = ObjectId()
+
+        key = (obj._tenant, fields["_id"])
+
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = dict(fields)
+            full = len(self._pending) >= self.max_size
+
+        if full:
+            self._wake.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        ''' Write everything that is waiting. '''
+        self._flush(raise_errors=self.on_error is None)
+
+    def close(self):
+        ''' Stop the background thread and write everything that is waiting. '''
+        if self._closed:
+            return
+
+        self._closed = True
+        self._wake.set()
+        self._worker.join()
+        self.flush()
+
+    def _flush(self, raise_errors=False):
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = OrderedDict()
+
+            # documents of each tenant go to that tenant's database
+            by_tenant = OrderedDict()
+            for (tenant, _), doc in pending.items():
+                by_tenant.setdefault(tenant, []).append(doc)
+
+            failed = []
+            for tenant, documents in by_tenant.items():
+                try:
+                    database.bulk_save(self.model._collection(tenant),
+                                       documents)
+                except Exception as e:
+                    if self.on_error is not None:
+                        self.on_error(e, documents)
+                    elif raise_errors:
+                        failed.append((tenant, documents, sys.exc_info()))
+                    else:
+                        logger.exception("Failed to write %d %s documents",
+                                         len(documents),
+                                         self.model.__name__)
+
+            if failed:
+                with self._lock:
+                    for tenant, documents, _ in failed:
+                        for doc in documents:
+                            # newer saves of the document win
+                            self._pending.setdefault((tenant, doc["_id"]), doc)
+
+                exc_info = failed[0][2]
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+            if not self._closed:
+                self._flush()
@@ -0,0 +1,191 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' JSON-schema constraint keywords, compiled once per schema. '''
+import re
+
+from exceptions import ValidationError, InvalidSchemaException
+
+KEYWORDS = frozenset([
+    "minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum", "pattern",
+    "enum", "minLength", "maxLength", "minItems", "maxItems", "uniqueItems",
+])
+
+
+def is_number(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+
+def compile_schema(schema, compiled=None):
+    ''' Compile the checks of `schema` and every schema nested in it, raising
+    InvalidSchemaException for bad constraints. Returns a dict of
+    (schema, checks) by id() of each schema; the schema is kept with its checks
+    so that its id can't be reused by another one. '''
+    if compiled is None:
+        compiled = {}
+
+    compiled[id(schema)] = (schema, compile_constraints(schema))
+
+    for subschema in schema.get("properties", {}).values():
+        compile_schema(subschema, compiled)
+
+    if isinstance(schema.get("items"), dict):
+        compile_schema(schema["items"], compiled)
+
+    return compiled
+
+
+def compile_constraints(schema):
+    ''' Build the checks for the constraint keywords in `schema`. Each check is
+    called with the field name and value and raises ValidationError. '''
+    if KEYWORDS.isdisjoint(schema):
+        return ()
+
+    checks = []
+
+    checks.extend(compile_bounds(schema))
+
+    if "pattern" in schema:
+        checks.append(compile_pattern(schema["pattern"]))
+
+    if "enum" in schema:
+        checks.append(compile_enum(schema["enum"]))
+
+    if "minLength" in schema or "maxLength" in schema:
+        checks.append(compile_length(basestring, "characters",
+                                     schema.get("minLength"),
+                                     schema.get("maxLength")))
+
+    if "minItems" in schema or "maxItems" in schema:
+        checks.append(compile_length(list, "items", schema.get("minItems"),
+                                     schema.get("maxItems")))
+
+    if schema.get("uniqueItems"):
+        checks.append(check_unique)
+
+    return tuple(checks)
+
+
+def compile_bounds(schema):
+    ''' Checks for minimum and maximum. exclusiveMinimum and exclusiveMaximum
+    may be booleans modifying them (draft 3/4) or bounds of their own. '''
+    checks = []
+
+    for bound, exclusive, below in [("minimum", "exclusiveMinimum", True),
+                                    ("maximum", "exclusiveMaximum", False)]:
+        limits = []
+
+        if bound in schema:
+            limits.append((schema[bound], schema.get(exclusive) is True))
+        if is_number(schema.get(exclusive)):
+            limits.append((schema[exclusive], True))
+
+        for limit, strict in limits:
+            if not is_number(limit):
+                raise InvalidSchemaException("'%s' must be a number, got '%s'" %
+                                             (bound, limit))
+            checks.append(bound_check(limit, strict, below))
+
+    return checks
+
+
+def bound_check(limit, strict, below):
+    if below:
+        message = "Field '%%s' must be %s %s, received '%%s'" % \
+            ("greater than" if strict else "at least", limit)
+        if strict:
+            failed = lambda value: value <= limit
+        else:
+            failed = lambda value: value < limit
+    else:
+        message = "Field '%%s' must be %s %s, received '%%s'" % \
+            ("less than" if strict else "at most", limit)
+        if strict:
+            failed = lambda value: value >= limit
+        else:
+            failed = lambda value: value > limit
+
+    def check(key, value):
+        if is_number(value) and failed(value):
+            raise ValidationError(message % (key, value))
+
+    return check
+
+
+def compile_pattern(pattern):
+    try:
+        regex = re.compile(pattern)
+    except (re.error, TypeError) as e:
+        raise InvalidSchemaException("Invalid pattern '%s': %s" % (pattern, e))
+
+    def check(key, value):
+        if isinstance(value, basestring) and not regex.search(value):
+            raise ValidationError("Field '%s' must match '%s', received '%s'" %
+                                  (key, pattern, value))
+
+    return check
+
+
+def compile_enum(values):
+    if not isinstance(values, list):
+        raise InvalidSchemaException("'enum' must be a list, got '%s'" %
+                                     (values,))
+
+    try:
+        allowed = frozenset(values)
+    except TypeError:
+        # objects or arrays in the enum, compare one by one
+        allowed = values
+
+    def check(key, value):
+        try:
+            found = value in allowed
+        except TypeError:
+            found = value in values
+
+        if not found:
+            raise ValidationError("Field '%s' must be one of %s, received '%s'" %
+                                  (key, values, value))
+
+    return check
+
+
+def compile_length(kind, unit, minimum, maximum):
+    def check(key, value):
+        if not isinstance(value, kind):
+            return
+
+        if minimum is not None and len(value) < minimum:
+            raise ValidationError("Field '%s' must have at least %s %s, "
+                                  "received %s" % (key, minimum, unit,
+                                                   len(value)))
+        if maximum is not None and len(value) > maximum:
+            raise ValidationError("Field '%s' must have at most %s %s, "
+                                  "received %s" % (key, maximum, unit,
+                                                   len(value)))
+
+    return check
+
+
+def check_unique(key, value):
+    if not isinstance(value, list):
+        return
+
+    try:
+        unique = len(set(value)) == len(value)
+    except TypeError:
+        unique = all(item not in value[:i] for i, item in enumerate(value))
+
+    if not unique:
+        raise ValidationError("Field '%s' must not contain duplicates" % key)
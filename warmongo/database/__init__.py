@@ -0,0 +1,128 @@
+''' Interface to pymongo, or to another storage backend that looks like it.
+'''
+import pymongo
+
+from memory import MemoryClient
+
+
+class NotConnected(RuntimeError):
+    pass
+
+# List of all the databases we have connected to
+connections = {}
+
+# List of databases
+databases = {}
+
+# The first connection we make is the default database
+default_database = None
+
+# Arguments of the connect() calls made, see reconnect()
+connect_calls = []
+
+# Client classes of the storage backends, called with (host, port). A backend
+# has to provide the parts of pymongo's client, database, collection and
+# cursor APIs that warmongo uses.
+backends = {
+    "mongo": pymongo.MongoClient,
+    "memory": MemoryClient,
+}
+
+
+def register_backend(name, client_class):
+    ''' Make a storage backend available to connect(). '''
+    backends[name] = client_class
+
+
+def connect(database, username=None, password=None, host="localhost", port=27017,
+            backend="mongo"):
+    ''' Connect to a database. Pass backend="memory" to keep the database in
+    this process instead of connecting to MongoDB. '''
+    global default_database
+
+    try:
+        client_class = backends[backend]
+    except KeyError:
+        raise ValueError("Unknown storage backend '%s'" % backend)
+
+    identifier = (backend, host, port)
+
+    connection = connections.get(identifier)
+
+    if connection is None:
+        connection = client_class(host, port)
+
+    connections[identifier] = connection
+
+    if not database in databases:
+        db = connection[database]
+
+        if username is not None and password is not None:
+            db.authenticate(username, password)
+
+        databases[database] = db
+        connect_calls.append((database, username, password, host, port,
+                              backend))
+
+        if default_database is None:
+            default_database = db
+
+
+def reconnect():
+    ''' Drop every connection and make them again with the same arguments.
+    Call this in processes forked after connecting, since they can't share
+    their parent's connections. '''
+    global default_database
+
+    calls = list(connect_calls)
+
+    connections.clear()
+    databases.clear()
+    del connect_calls[:]
+    default_database = None
+
+    for args in calls:
+        connect(*args)
+
+
+def get_database(database=None):
+    ''' Get a database by name, or the default database. '''
+    global default_database
+
+    # Check default
+    if database is None:
+        if default_database is None:
+            raise NotConnected("no connection to the database has been made.")
+        else:
+            return default_database
+    try:
+        return databases[database]
+    except KeyError:
+        raise NotConnected("connect() hasn't been called on '%s'" % database)
+
+
+def get_collection(collection, database=None):
+    return get_database(database)[collection]
+
+
+def bulk_save(collection, documents):
+    ''' Save a number of documents, replacing any existing document with the
+    same _id, in as few round trips as the driver allows. Every document must
+    have an _id. '''
+    if not documents:
+        return
+
+    if hasattr(collection, "bulk_write"):
+        # pymongo 3+
+        requests = [pymongo.ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+                    for doc in documents]
+        collection.bulk_write(requests, ordered=False)
+    elif hasattr(collection, "initialize_unordered_bulk_op"):
+        # pymongo 2.7+
+        bulk = collection.initialize_unordered_bulk_op()
+        for doc in documents:
+            bulk.find({"_id": doc["_id"]}).upsert().replace_one(doc)
+        bulk.execute()
+    else:
+        for doc in documents:
+            collection.save(doc, safe=True)
@@ -0,0 +1,232 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Evaluation of MongoDB aggregation pipelines against plain documents. '''
+from collections import OrderedDict
+from copy import deepcopy
+
+from pymongo.errors import OperationFailure
+
+from query import matches, lookup, freeze, sort_key, values_equal, \
+    sort_documents, project, set_path
+
+# Value of fields that aren't in a document
+MISSING = object()
+
+
+def evaluate(expression, document):
+    ''' Get the value of an aggregation expression for `document`. Supports
+    field paths ("$field"), objects of expressions and $literal. '''
+    if isinstance(expression, basestring) and expression.startswith("$"):
+        values = lookup(document, expression[1:])
+        if not values:
+            return MISSING
+        return values[0]
+    elif isinstance(expression, dict):
+        if len(expression) == 1 and expression.keys()[0].startswith("$"):
+            operator, argument = expression.items()[0]
+            if operator == "$literal":
+                return argument
+            raise OperationFailure("Unsupported expression operator %s" %
+                                   operator)
+
+        result = {}
+        for key, value in expression.items():
+            value = evaluate(value, document)
+            if value is not MISSING:
+                result[key] = value
+        return result
+    elif isinstance(expression, list):
+        return [present(evaluate(item, document)) for item in expression]
+    return expression
+
+
+def present(value):
+    if value is MISSING:
+        return None
+    return value
+
+
+def is_number(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+
+def is_flag(value):
+    return isinstance(value, (bool, int, long, float))
+
+
+def project_stage(documents, spec):
+    if all(is_flag(value) for value in spec.values()):
+        for document in documents:
+            yield project(document, spec)
+        return
+
+    for document in documents:
+        result = {}
+        if spec.get("_id", True) and "_id" in document:
+            result["_id"] = document["_id"]
+
+        for field, expression in spec.items():
+            if is_flag(expression):
+                values = lookup(document, field) if expression else []
+                if values and field != "_id":
+                    set_path(result, field, values[0])
+                elif not expression and field == "_id":
+                    result.pop("_id", None)
+            else:
+                value = evaluate(expression, document)
+                if value is not MISSING:
+                    set_path(result, field, value)
+
+        yield result
+
+
+def unwind_stage(documents, spec):
+    if isinstance(spec, dict):
+        spec = spec["path"]
+    field = spec[1:]
+
+    for document in documents:
+        values = lookup(document, field)
+        if not values or not isinstance(values[0], list):
+            if values and values[0] is not None:
+                yield document
+            continue
+
+        for item in values[0]:
+            unwound = deepcopy(document)
+            set_path(unwound, field, item)
+            yield unwound
+
+
+def accumulate(operator, values):
+    ''' Combine the values of a group's documents for one accumulator. '''
+    if operator == "$sum":
+        return sum(value for value in values if is_number(value))
+    elif operator == "$avg":
+        numbers = [value for value in values if is_number(value)]
+        if not numbers:
+            return None
+        return sum(numbers) / float(len(numbers))
+    elif operator in ("$min", "$max"):
+        values = [value for value in values
+                  if value is not MISSING and value is not None]
+        if not values:
+            return None
+        pick = min if operator == "$min" else max
+        return pick(values, key=sort_key)
+    elif operator == "$push":
+        return [value for value in values if value is not MISSING]
+    elif operator == "$addToSet":
+        unique = []
+        for value in values:
+            if value is not MISSING and \
+                    not any(values_equal(value, seen) for seen in unique):
+                unique.append(value)
+        return unique
+    elif operator == "$first":
+        return present(values[0]) if values else None
+    elif operator == "$last":
+        return present(values[-1]) if values else None
+    raise OperationFailure("Unsupported accumulator %s" % operator)
+
+
+def group_stage(documents, spec):
+    accumulators = []
+    for field, accumulator in spec.items():
+        if field == "_id":
+            continue
+        if not isinstance(accumulator, dict) or len(accumulator) != 1:
+            raise OperationFailure("The field '%s' must be an accumulator "
+                                   "object" % field)
+        accumulators.append((field,) + accumulator.items()[0])
+
+    groups = OrderedDict()
+    for document in documents:
+        key = present(evaluate(spec.get("_id"), document))
+        group = groups.get(freeze(key))
+        if group is None:
+            group = groups[freeze(key)] = (key, [[] for _ in accumulators])
+
+        for values, (field, operator, argument) in zip(group[1], accumulators):
+            values.append(evaluate(argument, document))
+
+    for key, collected in groups.values():
+        result = {"_id": key}
+        for values, (field, operator, argument) in zip(collected, accumulators):
+            result[field] = accumulate(operator, values)
+        yield result
+
+
+def sort_stage(documents, spec):
+    if isinstance(spec, dict):
+        spec = spec.items()
+    for document in sort_documents(documents, list(spec)):
+        yield document
+
+
+def skip_stage(documents, skip):
+    for i, document in enumerate(documents):
+        if i >= skip:
+            yield document
+
+
+def limit_stage(documents, limit):
+    if limit <= 0:
+        return
+    for i, document in enumerate(documents):
+        yield document
+        if i + 1 >= limit:
+            return
+
+
+def count_stage(documents, field):
+    total = sum(1 for document in documents)
+    if total:
+        yield {field: total}
+
+
+def run_pipeline(documents, pipeline):
+    ''' Pass `documents` through the stages of `pipeline`. Returns an
+    iterator; stages other than $sort and $group don't hold on to the
+    documents. '''
+    results = iter(documents)
+
+    for stage in pipeline:
+        if len(stage) != 1:
+            raise OperationFailure("A pipeline stage must have exactly one "
+                                   "field")
+        name, spec = stage.items()[0]
+
+        if name == "$match":
+            results = (document for document in results
+                       if matches(document, spec))
+        elif name == "$project":
+            results = project_stage(results, spec)
+        elif name == "$unwind":
+            results = unwind_stage(results, spec)
+        elif name == "$group":
+            results = group_stage(results, spec)
+        elif name == "$sort":
+            results = sort_stage(results, spec)
+        elif name == "$skip":
+            results = skip_stage(results, spec)
+        elif name == "$limit":
+            results = limit_stage(results, spec)
+        elif name == "$count":
+            results = count_stage(results, spec)
+        else:
+            raise OperationFailure("Unsupported pipeline stage %s" % name)
+
+    return results
@@ -0,0 +1,695 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' In-process storage backend implementing the part of pymongo's collection
+API that warmongo uses. Connect to it with connect(..., backend="memory"). '''
+import threading
+
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from copy import deepcopy
+from itertools import count as counter
+
+from bson import ObjectId
+from pymongo import ASCENDING, HASHED
+from pymongo.errors import DuplicateKeyError, InvalidOperation
+
+from query import matches, lookup, freeze, sort_key, type_rank, \
+    sort_documents, project, apply_update, upsert_base, is_operator_dict, \
+    RegexType
+from aggregation import run_pipeline
+
+# Sorts after every sequence number in a sorted index
+INFINITY = float("inf")
+
+# Operators a sorted index can answer
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+
+def index_list(key_or_list, direction=None):
+    ''' Normalize an index or sort specification into a list of
+    (field, direction). '''
+    if direction is not None:
+        return [(key_or_list, direction)]
+    elif isinstance(key_or_list, basestring):
+        return [(key_or_list, ASCENDING)]
+    return list(key_or_list)
+
+
+def index_keys(document, field):
+    ''' The keys `document` has in an index over `field`. Arrays are indexed
+    by their elements and missing fields as null. '''
+    values = lookup(document, field)
+    if not values:
+        return set([sort_key(None)])
+
+    keys = set()
+    for value in values:
+        if isinstance(value, list) and value:
+            keys.update(sort_key(item) for item in value)
+        else:
+            keys.add(sort_key(value))
+    return keys
+
+
+def indexable(condition):
+    ''' Whether an equality condition can be looked up in an index. '''
+    return not isinstance(condition, (dict, list, RegexType))
+
+
+class HashIndex(object):
+    ''' Index answering equality and $in conditions. '''
+
+    def __init__(self, name, field, unique=False):
+        self.name = name
+        self.field = field
+        self.unique = unique
+        self.entries = {}
+
+    def add(self, id_key, seq, document):
+        for key in index_keys(document, self.field):
+            self.entries.setdefault(key, set()).add(id_key)
+
+    def remove(self, id_key, seq, document):
+        for key in index_keys(document, self.field):
+            ids = self.entries.get(key)
+            if ids is not None:
+                ids.discard(id_key)
+                if not ids:
+                    del self.entries[key]
+
+    def conflicts(self, id_key, document):
+        ''' Check whether `document` would break a unique constraint. '''
+        for key in index_keys(document, self.field):
+            if self.entries.get(key, set()) - set([id_key]):
+                return True
+        return False
+
+    def equal(self, value):
+        return set(self.entries.get(sort_key(value), ()))
+
+    def range(self, bounds):
+        return None
+
+
+class SortedIndex(HashIndex):
+    ''' Index answering equality, $in and range conditions. '''
+
+    def __init__(self, name, field, unique=False):
+        HashIndex.__init__(self, name, field, unique)
+        self.keys = []
+        # whether a document has several keys, i.e. array elements
+        self.multikey = False
+
+    def add(self, id_key, seq, document):
+        HashIndex.add(self, id_key, seq, document)
+        keys = index_keys(document, self.field)
+        if len(keys) > 1:
+            self.multikey = True
+        for key in keys:
+            insort(self.keys, key + (seq, id_key))
+
+    def remove(self, id_key, seq, document):
+        HashIndex.remove(self, id_key, seq, document)
+        for key in index_keys(document, self.field):
+            position = bisect_left(self.keys, key + (seq,))
+            if position < len(self.keys) and self.keys[position][2] == seq:
+                del self.keys[position]
+
+    def range(self, bounds):
+        ''' Find the documents within `bounds`, a dict of range operators.
+        Only bounds of the same type can be combined, like in MongoDB. '''
+        ranks = set(type_rank(value) for value in bounds.values())
+        if len(ranks) != 1:
+            return None
+        rank = ranks.pop()
+
+        if self.multikey:
+            # each bound may be met by a different element of an array
+            found = None
+            for operator, value in bounds.items():
+                ids = self.scan(rank, {operator: value})
+                found = ids if found is None else found & ids
+            return found
+
+        return self.scan(rank, bounds)
+
+    def scan(self, rank, bounds):
+        ''' Find the documents with a key of type `rank` within all of
+        `bounds`. '''
+        start = bisect_left(self.keys, (rank,))
+        end = bisect_left(self.keys, (rank + 1,))
+
+        for operator, value in bounds.items():
+            key = sort_key(value)
+            if operator == "$gt":
+                start = max(start, bisect_right(self.keys, key + (INFINITY,)))
+            elif operator == "$gte":
+                start = max(start, bisect_left(self.keys, key))
+            elif operator == "$lt":
+                end = min(end, bisect_left(self.keys, key))
+            elif operator == "$lte":
+                end = min(end, bisect_right(self.keys, key + (INFINITY,)))
+
+        return set(entry[3] for entry in self.keys[start:end])
+
+
+class MemoryCursor(object):
+    ''' The part of pymongo's Cursor that warmongo uses. The query runs the
+    first time results are needed. '''
+
+    def __init__(self, collection, spec=None, fields=None, skip=0, limit=0,
+                 sort=None):
+        self.__collection = collection
+        self.__spec = spec or {}
+        self.__fields = fields
+        self.__skip = skip
+        self.__limit = limit
+        self.__sort = index_list(sort) if sort else None
+        self.__results = None
+        self.__position = 0
+        self.__stats = None
+
+    @property
+    def collection(self):
+        return self.__collection
+
+    @property
+    def alive(self):
+        return self.__results is None or \
+            self.__position < len(self.__results)
+
+    def __check_okay_to_chain(self):
+        if self.__results is not None:
+            raise InvalidOperation("cannot set options after executing query")
+
+    def sort(self, key_or_list, direction=None):
+        self.__check_okay_to_chain()
+        self.__sort = index_list(key_or_list, direction)
+        return self
+
+    def skip(self, skip):
+        self.__check_okay_to_chain()
+        self.__skip = skip
+        return self
+
+    def limit(self, limit):
+        self.__check_okay_to_chain()
+        self.__limit = limit
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def hint(self, index):
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        return self
+
+    def clone(self):
+        return MemoryCursor(self.__collection, self.__spec, self.__fields,
+                            self.__skip, self.__limit, self.__sort)
+
+    def rewind(self):
+        self.__results = None
+        self.__position = 0
+        return self
+
+    def close(self):
+        self.__results = []
+        self.__position = 0
+
+    def count(self, with_limit_and_skip=False):
+        if with_limit_and_skip:
+            documents, _ = self.__collection._run(
+                self.__spec, skip=self.__skip, limit=self.__limit)
+        else:
+            documents, _ = self.__collection._run(self.__spec)
+        return len(documents)
+
+    def explain(self):
+        ''' Describe how the query runs, in the shape of MongoDB's explain
+        output. '''
+        documents, stats = self.__collection._run(
+            self.__spec, self.__sort, self.__skip, self.__limit)
+
+        if stats["index"] is None:
+            plan = {"stage": "COLLSCAN"}
+        else:
+            plan = {"stage": "FETCH",
+                    "inputStage": {"stage": "IXSCAN",
+                                   "indexName": stats["index"]}}
+
+        return {
+            "queryPlanner": {"winningPlan": plan},
+            "executionStats": {
+                "nReturned": len(documents),
+                "totalKeysExamined": stats["keys"],
+                "totalDocsExamined": stats["examined"],
+            }
+        }
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+
+        cursor = self.clone()
+        cursor.__skip = self.__skip + index
+        cursor.__limit = 1
+        for document in cursor:
+            return document
+        raise IndexError("no such item for Cursor instance")
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.__results is None:
+            documents, self.__stats = self.__collection._run(
+                self.__spec, self.__sort, self.__skip, self.__limit)
+            self.__results = [project(document, self.__fields)
+                              for document in documents]
+
+        if self.__position >= len(self.__results):
+            raise StopIteration
+
+        document = self.__results[self.__position]
+        self.__position += 1
+        return document
+
+    __next__ = next
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MemoryCollection(object):
+    ''' A collection kept in memory. Documents are copied on the way in and
+    out, so changing a result doesn't change what is stored. '''
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = "%s.%s" % (database.name, name)
+
+        self._documents = OrderedDict()
+        self._seqs = {}
+        self._next_seq = counter()
+        self._indexes = {}
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return "MemoryCollection(%r, %r)" % (self.database, self.name)
+
+    # Indexes
+
+    def ensure_index(self, key_or_list, cache_for=300, **kwargs):
+        ''' Create an index if it doesn't exist yet. Hashed indexes answer
+        equality and $in conditions; ascending and descending ones answer
+        ranges too. Compound indexes are used for their first field. '''
+        keys = index_list(key_or_list)
+        name = kwargs.get("name") or \
+            "_".join("%s_%s" % (field, direction) for field, direction in keys)
+
+        with self._lock:
+            if name in self._indexes:
+                return name
+
+            field, direction = keys[0]
+            if direction == HASHED:
+                klass = HashIndex
+            else:
+                klass = SortedIndex
+
+            index = klass(name, field, unique=kwargs.get("unique", False))
+
+            for id_key, document in self._documents.items():
+                if index.unique and index.conflicts(id_key, document):
+                    raise DuplicateKeyError("E11000 duplicate key error "
+                                            "index: %s" % name)
+                index.add(id_key, self._seqs[id_key], document)
+
+            self._indexes[name] = index
+            return name
+
+    create_index = ensure_index
+
+    def drop_index(self, index_or_name):
+        with self._lock:
+            self._indexes.pop(index_or_name, None)
+
+    def drop_indexes(self):
+        with self._lock:
+            self._indexes = {}
+
+    def index_information(self):
+        information = {"_id_": {"key": [("_id", ASCENDING)]}}
+        for name, index in self._indexes.items():
+            information[name] = {"key": [(index.field, ASCENDING)]}
+            if index.unique:
+                information[name]["unique"] = True
+        return information
+
+    # Reading
+
+    def find(self, *args, **kwargs):
+        spec = kwargs.pop("spec", kwargs.pop("filter", None))
+        fields = kwargs.pop("fields", kwargs.pop("projection", None))
+
+        if args:
+            spec = args[0]
+        if len(args) > 1:
+            fields = args[1]
+
+        return MemoryCursor(self, spec, fields, kwargs.get("skip", 0),
+                            kwargs.get("limit", 0), kwargs.get("sort"))
+
+    def find_one(self, spec_or_id=None, *args, **kwargs):
+        if spec_or_id is not None and not isinstance(spec_or_id, dict):
+            spec_or_id = {"_id": spec_or_id}
+
+        for document in self.find(spec_or_id, *args, **kwargs).limit(1):
+            return document
+        return None
+
+    def count(self):
+        return len(self._documents)
+
+    def aggregate(self, pipeline, **kwargs):
+        ''' Run an aggregation pipeline. Returns an iterator over the results,
+        like the command cursor of newer drivers; options such as allowDiskUse
+        and batchSize are accepted and ignored. '''
+        pipeline = list(pipeline)
+
+        # a leading $match can use the indexes
+        spec = {}
+        if pipeline and pipeline[0].keys() == ["$match"]:
+            spec = pipeline.pop(0)["$match"]
+
+        documents, _ = self._run(spec)
+        return run_pipeline((deepcopy(document) for document in documents),
+                            pipeline)
+
+    def _plan(self, spec):
+        ''' Use the indexes to narrow down the documents that can match
+        `spec`. Returns the candidate ids (None for all documents), the name of
+        the index used and how many keys were looked at. '''
+        candidates = None
+        used = None
+
+        for field, condition in spec.items():
+            if field.startswith("$"):
+                continue
+
+            if field == "_id":
+                found = self._lookup_ids(condition)
+                name = "_id_"
+            else:
+                index = self._index_for(field)
+                if index is None:
+                    continue
+
+                found = self._lookup(index, condition)
+                name = index.name
+
+            if found is None:
+                continue
+
+            if candidates is None or len(found) < len(candidates):
+                used = name
+            candidates = found if candidates is None else candidates & found
+
+        if candidates is None:
+            return None, None, 0
+        return candidates, used, len(candidates)
+
+    def _lookup_ids(self, condition):
+        ''' Documents are stored by _id, so that works like a hashed index. '''
+        if is_operator_dict(condition) and list(condition) == ["$in"]:
+            values = condition["$in"]
+        else:
+            values = [condition]
+
+        if not all(indexable(value) for value in values):
+            return None
+
+        return set(freeze(value) for value in values
+                   if freeze(value) in self._documents)
+
+    def _index_for(self, field):
+        ''' Prefer sorted indexes since they can answer more conditions. '''
+        found = None
+        for index in self._indexes.values():
+            if index.field == field:
+                if isinstance(index, SortedIndex):
+                    return index
+                found = index
+        return found
+
+    def _lookup(self, index, condition):
+        if not is_operator_dict(condition):
+            if indexable(condition):
+                return index.equal(condition)
+            return None
+
+        found = None
+        bounds = {}
+
+        for operator, argument in condition.items():
+            if operator == "$eq" and indexable(argument):
+                ids = index.equal(argument)
+            elif operator == "$in" and all(indexable(item)
+                                           for item in argument):
+                ids = set()
+                for item in argument:
+                    ids |= index.equal(item)
+            elif operator in RANGE_OPERATORS:
+                bounds[operator] = argument
+                continue
+            else:
+                continue
+
+            found = ids if found is None else found & ids
+
+        if bounds:
+            ids = index.range(bounds)
+            if ids is not None:
+                found = ids if found is None else found & ids
+
+        return found
+
+    def _run(self, spec, sort=None, skip=0, limit=0):
+        ''' Run a query. Returns the matching documents (not copies) and some
+        statistics for explain(). '''
+        limit = abs(limit or 0)
+        skip = skip or 0
+
+        with self._lock:
+            candidates, index, keys = self._plan(spec)
+
+            if candidates is None:
+                source = self._documents.values()
+            else:
+                seqs = self._seqs
+                source = [self._documents[id_key] for id_key in
+                          sorted(candidates, key=lambda id_key: seqs[id_key])]
+
+            found = []
+            examined = 0
+            # without a sort we can stop as soon as we have enough
+            wanted = skip + limit if limit and not sort else None
+
+            for document in source:
+                examined += 1
+                if matches(document, spec):
+                    found.append(document)
+                    if wanted is not None and len(found) >= wanted:
+                        break
+
+        if sort:
+            found = sort_documents(found, sort)
+        if skip:
+            found = found[skip:]
+        if limit:
+            found = found[:limit]
+
+        return found, {"index": index, "keys": keys, "examined": examined}
+
+    # Writing
+
+    def _check_unique(self, id_key, document):
+        for index in self._indexes.values():
+            if index.unique and index.conflicts(id_key, document):
+                raise DuplicateKeyError("E11000 duplicate key error index: "
+                                        "%s.$%s" % (self.full_name,
+                                                    index.name))
+
+    def _store(self, document):
+        ''' Insert or replace a document (with _id) and update the indexes. '''
+        id_key = freeze(document["_id"])
+        self._check_unique(id_key, document)
+
+        old = self._documents.get(id_key)
+        if old is None:
+            self._seqs[id_key] = next(self._next_seq)
+        else:
+            for index in self._indexes.values():
+                index.remove(id_key, self._seqs[id_key], old)
+
+        self._documents[id_key] = document
+        for index in self._indexes.values():
+            index.add(id_key, self._seqs[id_key], document)
+
+    def _delete(self, id_key):
+        document = self._documents.pop(id_key)
+        seq = self._seqs.pop(id_key)
+        for index in self._indexes.values():
+            index.remove(id_key, seq, document)
+
+    def insert(self, doc_or_docs, *args, **kwargs):
+        single = isinstance(doc_or_docs, dict)
+        docs = [doc_or_docs] if single else list(doc_or_docs)
+
+        with self._lock:
+            ids = []
+            for doc in docs:
+                if "_id" not in doc:
+                    doc["_id"] = ObjectId()
+
+                if freeze(doc["_id"]) in self._documents:
+                    raise DuplicateKeyError("E11000 duplicate key error "
+                                            "index: %s.$_id_" % self.full_name)
+
+                self._store(deepcopy(doc))
+                ids.append(doc["_id"])
+
+        if single:
+            return ids[0]
+        return ids
+
+    def save(self, to_save, *args, **kwargs):
+        if "_id" not in to_save:
+            return self.insert(to_save)
+
+        with self._lock:
+            self._store(deepcopy(to_save))
+        return to_save["_id"]
+
+    def update(self, spec, document, upsert=False, manipulate=False,
+               safe=None, multi=False, *args, **kwargs):
+        with self._lock:
+            found, _ = self._run(spec, limit=0 if multi else 1)
+
+            for old in found:
+                new = apply_update(old, document)
+                if freeze(new.get("_id")) != freeze(old["_id"]):
+                    raise InvalidOperation("cannot change _id of a document")
+                self._store(new)
+
+            if not found and upsert:
+                new = apply_update(upsert_base(spec), document, inserting=True)
+                if "_id" not in new:
+                    new["_id"] = ObjectId()
+                self._store(new)
+
+                return {"ok": 1.0, "n": 1, "updatedExisting": False,
+                        "upserted": new["_id"], "err": None}
+
+        return {"ok": 1.0, "n": len(found), "updatedExisting": bool(found),
+                "err": None}
+
+    def remove(self, spec_or_id=None, safe=None, *args, **kwargs):
+        if spec_or_id is not None and not isinstance(spec_or_id, dict):
+            spec_or_id = {"_id": spec_or_id}
+
+        with self._lock:
+            found, _ = self._run(spec_or_id or {})
+            for document in found:
+                self._delete(freeze(document["_id"]))
+
+        return {"ok": 1.0, "n": len(found), "err": None}
+
+    def drop(self):
+        self.database.drop_collection(self.name)
+
+
+class MemoryDatabase(object):
+    ''' A database holding MemoryCollections. '''
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "MemoryDatabase(%r)" % self.name
+
+    def __getitem__(self, name):
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = MemoryCollection(self, name)
+                self._collections[name] = collection
+            return collection
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def authenticate(self, name, password=None, *args, **kwargs):
+        return True
+
+    def collection_names(self):
+        return list(self._collections.keys())
+
+    def drop_collection(self, name):
+        with self._lock:
+            self._collections.pop(name, None)
+
+
+class MemoryClient(object):
+    ''' Stand-in for pymongo's MongoClient that keeps everything in memory.
+    '''
+
+    def __init__(self, host="localhost", port=27017, *args, **kwargs):
+        self.host = host
+        self.port = port
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            database = self._databases.get(name)
+            if database is None:
+                database = MemoryDatabase(self, name)
+                self._databases[name] = database
+            return database
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def database_names(self):
+        return list(self._databases.keys())
+
+    def drop_database(self, name):
+        with self._lock:
+            self._databases.pop(name, None)
@@ -0,0 +1,386 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Evaluation of MongoDB queries, updates and sorts against plain documents.
+'''
+import re
+
+from copy import deepcopy
+from datetime import datetime
+
+from bson import ObjectId
+from bson.binary import Binary
+from bson.min_key import MinKey
+from bson.max_key import MaxKey
+from bson.timestamp import Timestamp
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+RegexType = type(re.compile(""))
+
+
+def type_rank(value):
+    ''' Position of the type of `value` in MongoDB's sort order. Values are
+    only compared with values of the same rank. '''
+    if isinstance(value, MinKey):
+        return 0
+    elif value is None:
+        return 1
+    elif isinstance(value, bool):
+        return 8
+    elif isinstance(value, (int, long, float)):
+        return 2
+    elif isinstance(value, Binary):
+        return 6
+    elif isinstance(value, basestring):
+        return 3
+    elif isinstance(value, dict):
+        return 4
+    elif isinstance(value, list):
+        return 5
+    elif isinstance(value, ObjectId):
+        return 7
+    elif isinstance(value, datetime):
+        return 9
+    elif isinstance(value, Timestamp):
+        return 10
+    elif isinstance(value, RegexType):
+        return 11
+    elif isinstance(value, MaxKey):
+        return 12
+    return 13
+
+
+def freeze(value):
+    ''' Turn `value` into something hashable that compares the same way. '''
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item))
+                            for key, item in value.items()))
+    elif isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    elif isinstance(value, RegexType):
+        return (value.pattern, value.flags)
+    return value
+
+
+def sort_key(value):
+    ''' Key that orders values the way MongoDB does. '''
+    return (type_rank(value), freeze(value))
+
+
+def values_equal(a, b):
+    return type_rank(a) == type_rank(b) and a == b
+
+
+def lookup(document, path):
+    ''' Get every value at the dotted `path` in `document`, going into arrays
+    the way MongoDB does. Returns an empty list if there is nothing there. '''
+    values = [document]
+
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit():
+                    if int(part) < len(value):
+                        found.append(value[int(part)])
+                else:
+                    found.extend(item[part] for item in value
+                                 if isinstance(item, dict) and part in item)
+        values = found
+
+    return values
+
+
+def expand(values):
+    ''' The values along with the elements of any arrays among them. '''
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            for item in value:
+                yield item
+
+
+def is_operator_dict(condition):
+    return isinstance(condition, dict) and len(condition) > 0 and \
+        all(key.startswith("$") for key in condition)
+
+
+def equals(values, condition):
+    if not values and condition is None:
+        return True
+
+    if isinstance(condition, RegexType):
+        return any(isinstance(value, basestring) and condition.search(value)
+                   for value in expand(values))
+
+    return any(values_equal(value, condition) for value in expand(values))
+
+
+def compare(values, condition, test):
+    rank = type_rank(condition)
+    return any(type_rank(value) == rank and test(value, condition)
+               for value in expand(values))
+
+
+def compile_regex(pattern, options=""):
+    flags = 0
+    for option in options:
+        flags |= {"i": re.I, "m": re.M, "s": re.S, "x": re.X}.get(option, 0)
+    return re.compile(pattern, flags)
+
+
+def apply_operators(values, condition):
+    ''' Check `values` against a dict of query operators. '''
+    for operator, argument in condition.items():
+        if operator == "$eq":
+            result = equals(values, argument)
+        elif operator == "$ne":
+            result = not equals(values, argument)
+        elif operator == "$gt":
+            result = compare(values, argument, lambda a, b: a > b)
+        elif operator == "$gte":
+            result = compare(values, argument, lambda a, b: a >= b)
+        elif operator == "$lt":
+            result = compare(values, argument, lambda a, b: a < b)
+        elif operator == "$lte":
+            result = compare(values, argument, lambda a, b: a <= b)
+        elif operator == "$in":
+            result = any(equals(values, item) for item in argument)
+        elif operator == "$nin":
+            result = not any(equals(values, item) for item in argument)
+        elif operator == "$exists":
+            result = bool(values) == bool(argument)
+        elif operator == "$regex":
+            if not isinstance(argument, RegexType):
+                argument = compile_regex(argument, condition.get("$options", ""))
+            result = equals(values, argument)
+        elif operator == "$options":
+            continue
+        elif operator == "$size":
+            result = any(isinstance(value, list) and len(value) == argument
+                         for value in values)
+        elif operator == "$all":
+            result = all(equals(values, item) for item in argument)
+        elif operator == "$elemMatch":
+            result = any(isinstance(value, list) and
+                         any(element_matches(item, argument) for item in value)
+                         for value in values)
+        elif operator == "$not":
+            if isinstance(argument, RegexType):
+                result = not equals(values, argument)
+            else:
+                result = not apply_operators(values, argument)
+        else:
+            raise OperationFailure("Unsupported query operator %s" % operator)
+
+        if not result:
+            return False
+
+    return True
+
+
+def element_matches(element, condition):
+    ''' Check an array element for $elemMatch and $pull. '''
+    if is_operator_dict(condition):
+        return apply_operators([element], condition)
+    elif isinstance(condition, dict):
+        return isinstance(element, dict) and matches(element, condition)
+    return values_equal(element, condition)
+
+
+def matches(document, spec):
+    ''' Check whether `document` matches the query `spec`. '''
+    for key, condition in spec.items():
+        if key == "$and":
+            if not all(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, sub) for sub in condition):
+                return False
+        elif key.startswith("$"):
+            raise OperationFailure("Unsupported query operator %s" % key)
+        else:
+            values = lookup(document, key)
+
+            if is_operator_dict(condition):
+                if not apply_operators(values, condition):
+                    return False
+            elif not equals(values, condition):
+                return False
+
+    return True
+
+
+def sort_documents(documents, sort):
+    ''' Sort `documents` by a list of (field, direction). '''
+    documents = list(documents)
+
+    # stable sorts from the last key to the first
+    for field, direction in reversed(sort):
+        documents.sort(key=lambda doc: sort_key(first(lookup(doc, field))),
+                       reverse=direction != ASCENDING)
+
+    return documents
+
+
+def first(values):
+    if values:
+        return values[0]
+    return None
+
+
+def project(document, fields):
+    ''' Copy the parts of `document` selected by a projection. '''
+    if fields is None:
+        return deepcopy(document)
+
+    if not isinstance(fields, dict):
+        fields = dict((field, 1) for field in fields)
+
+    include_id = fields.get("_id", True)
+    selected = dict((field, value) for field, value in fields.items()
+                    if field != "_id")
+
+    if any(selected.values()):
+        result = {}
+        for field in selected:
+            values = lookup(document, field)
+            if values:
+                set_path(result, field, deepcopy(values[0]))
+    else:
+        result = deepcopy(document)
+        for field in selected:
+            unset_path(result, field)
+
+    if include_id and "_id" in document:
+        result["_id"] = deepcopy(document["_id"])
+    elif not include_id:
+        result.pop("_id", None)
+
+    return result
+
+
+def set_path(document, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        if isinstance(document, list):
+            document = document[int(part)]
+        else:
+            document = document.setdefault(part, {})
+
+    if isinstance(document, list):
+        document[int(parts[-1])] = value
+    else:
+        document[parts[-1]] = value
+
+
+def unset_path(document, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        if isinstance(document, dict):
+            document = document.get(part)
+        elif isinstance(document, list) and part.isdigit() and \
+                int(part) < len(document):
+            document = document[int(part)]
+        else:
+            return
+
+    if isinstance(document, dict):
+        document.pop(parts[-1], None)
+
+
+def get_path(document, path, default=None):
+    values = lookup(document, path)
+    if values:
+        return values[0]
+    return default
+
+
+def each(argument):
+    if isinstance(argument, dict) and "$each" in argument:
+        return argument["$each"]
+    return [argument]
+
+
+def apply_update(document, update, inserting=False):
+    ''' Apply an update document to `document`, returning the new version. '''
+    if not any(key.startswith("$") for key in update):
+        # replace the whole document
+        replacement = deepcopy(update)
+        if "_id" in document:
+            replacement["_id"] = document["_id"]
+        return replacement
+
+    document = deepcopy(document)
+
+    for operator, changes in update.items():
+        for path, argument in changes.items():
+            if operator == "$set":
+                set_path(document, path, deepcopy(argument))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    set_path(document, path, deepcopy(argument))
+            elif operator == "$unset":
+                unset_path(document, path)
+            elif operator == "$inc":
+                set_path(document, path, get_path(document, path, 0) + argument)
+            elif operator in ("$push", "$addToSet"):
+                array = get_path(document, path)
+                if array is None:
+                    array = []
+                    set_path(document, path, array)
+                elif not isinstance(array, list):
+                    raise OperationFailure("Cannot apply %s to non-array "
+                                           "field '%s'" % (operator, path))
+
+                for item in each(argument):
+                    if operator == "$push" or \
+                            not any(values_equal(item, existing)
+                                    for existing in array):
+                        array.append(deepcopy(item))
+            elif operator == "$pull":
+                array = get_path(document, path)
+                if isinstance(array, list):
+                    array[:] = [item for item in array
+                                if not element_matches(item, argument)]
+            elif operator == "$pop":
+                array = get_path(document, path)
+                if isinstance(array, list) and array:
+                    array.pop(0 if argument < 0 else -1)
+            else:
+                raise OperationFailure("Unsupported update operator %s" %
+                                       operator)
+
+    return document
+
+
+def upsert_base(spec):
+    ''' The document an upsert starts from: the equality fields of `spec`. '''
+    document = {}
+    for key, condition in spec.items():
+        if key.startswith("$"):
+            continue
+        if is_operator_dict(condition):
+            if "$eq" in condition:
+                set_path(document, key, deepcopy(condition["$eq"]))
+        else:
+            set_path(document, key, deepcopy(condition))
+    return document
@@ -23,3 +23,11 @@ class ValidationError(Exception):
 class InvalidReloadException(Exception):
     ''' Thrown when we attempt to call reload() on a model that is not in the
     database. '''
+
+class ReadOnlyException(Exception):
+    ''' Thrown when we attempt to change or save a read-only record. '''
+    pass
+
+class UnknownModelException(Exception):
+    ''' Thrown when restoring an object of a model that isn't registered. '''
+    pass
@@ -0,0 +1,226 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Rewriting every document of a collection when its schema changes. '''
+import logging
+import multiprocessing
+import os
+import time
+
+from bson import json_util
+from pymongo import ASCENDING
+
+import database
+from database.memory import MemoryCollection
+from profiler import ProfiledCollection
+from serialization import reference, resolve
+
+logger = logging.getLogger("warmongo")
+
+
+def partition_bounds(collection, query, partitions):
+    ''' Split the documents matching `query` into `partitions` ranges of _id
+    of about the same size. Returns the partitions + 1 boundaries, None
+    standing for no bound. '''
+    total = collection.find(query).count()
+
+    bounds = [None]
+    for i in range(1, partitions):
+        cursor = collection.find(query, {"_id": True}).sort("_id", ASCENDING) \
+            .skip(total * i // partitions).limit(1)
+        for document in cursor:
+            if document["_id"] != bounds[-1]:
+                bounds.append(document["_id"])
+    bounds.append(None)
+
+    return bounds
+
+
+def read_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json_util.loads(f.read())
+
+
+def write_json(path, data):
+    # write and rename, so a crash never leaves half a file
+    with open(path + ".tmp", "w") as f:
+        f.write(json_util.dumps(data))
+    os.rename(path + ".tmp", path)
+
+
+def save_batch(collection, batch, checkpoint, last_id, path):
+    ''' Write a batch of migrated documents, then record that everything up
+    to `last_id` is done. '''
+    database.bulk_save(collection, batch)
+
+    checkpoint["migrated"] += len(batch)
+    checkpoint["last_id"] = last_id
+    write_json(path, checkpoint)
+
+    return len(batch)
+
+
+def run_partition(task):
+    ''' Migrate the documents of one _id range, starting after the last one
+    checkpointed. '''
+    (model, transform, version, version_field, query, tenant, lower, upper,
+     batch_size, rate, path) = task
+
+    model = resolve(model)
+
+    checkpoint = read_json(path) or {"version": version, "last_id": None,
+                                     "migrated": 0, "skipped": 0,
+                                     "done": False}
+    if checkpoint["done"]:
+        return checkpoint
+
+    id_range = {}
+    if checkpoint["last_id"] is not None:
+        id_range["$gt"] = checkpoint["last_id"]
+    elif lower is not None:
+        id_range["$gte"] = lower
+    if upper is not None:
+        id_range["$lt"] = upper
+
+    spec = query
+    if id_range:
+        spec = {"$and": [query, {"_id": id_range}]} if query else \
+            {"_id": id_range}
+
+    collection = model._collection(tenant)
+    cursor = collection.find(spec).sort("_id", ASCENDING) \
+        .batch_size(batch_size)
+
+    started = time.time()
+    written = 0
+    batch = []
+    seen = 0
+
+    for document in cursor:
+        seen += 1
+
+        result = transform(document)
+        if result is None:
+            checkpoint["skipped"] += 1
+        else:
+            result.setdefault("_id", document["_id"])
+            if version_field is not None:
+                result[version_field] = version
+            # cast and validate against the current schema
+            batch.append(model(result, tenant=tenant).to_dict())
+
+        if seen == batch_size:
+            written += save_batch(collection, batch, checkpoint,
+                                  document["_id"], path)
+            batch = []
+            seen = 0
+
+            if rate:
+                # sleep off whatever is ahead of the allowed rate
+                delay = written / rate - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+    if seen:
+        save_batch(collection, batch, checkpoint, document["_id"], path)
+
+    checkpoint["done"] = True
+    write_json(path, checkpoint)
+    return checkpoint
+
+
+def migrate(model, transform, version, query=None, partitions=4,
+            processes=None, batch_size=500, max_rate=None, checkpoint_dir=".",
+            tenant=None, version_field=None):
+    ''' Rewrite the documents of `model` matching `query` with `transform`.
+
+    `transform` gets each document as a dict and returns the new document, or
+    None to leave it alone. The results are cast and validated against the
+    model's schema and saved in bulk. `version` names the migration: progress
+    is checkpointed to files in `checkpoint_dir` named after the collection
+    and the version, so running the same version again after a crash picks up
+    where it stopped, and running a finished one does nothing.
+
+    A batch is checkpointed after it is written, so a crash in between means
+    its documents are transformed again on resume. Either make `transform`
+    idempotent, or pass a `version_field`: each rewritten document then gets
+    `version` stored in that field (which the schema has to allow), and
+    documents that already have it are left out.
+
+    The collection is split into `partitions` _id ranges migrated by
+    `processes` worker processes (one per partition by default, 0 to migrate
+    in this process). `transform` has to be picklable, that is, a module level
+    function, to be sent to the workers, and the workers need their own
+    connections, so the memory backend only works with processes=0.
+    `max_rate` limits the documents written per second, across all workers.
+
+    Returns the number of documents migrated and skipped. '''
+    collection = model._collection(tenant)
+    if isinstance(collection, ProfiledCollection):
+        collection = collection._collection
+    if processes != 0 and isinstance(collection, MemoryCollection):
+        # workers would reconnect to empty in-memory databases
+        raise ValueError("Collections of the memory backend can only be "
+                         "migrated with processes=0")
+
+    query = query or {}
+    if version_field is not None:
+        stamp = {version_field: {"$ne": version}}
+        query = {"$and": [query, stamp]} if query else stamp
+
+    prefix = model.collection_name()
+    if tenant is not None:
+        prefix += "." + str(tenant)
+    prefix = os.path.join(checkpoint_dir, "%s.v%s" % (prefix, version))
+
+    # a resumed migration keeps the partitions it started with
+    plan = read_json(prefix + ".json")
+    if plan is None:
+        plan = {"version": version,
+                "bounds": partition_bounds(collection, query, partitions)}
+        write_json(prefix + ".json", plan)
+
+    bounds = plan["bounds"]
+    ranges = zip(bounds[:-1], bounds[1:])
+
+    if processes is None:
+        processes = len(ranges)
+
+    workers = max(min(processes, len(ranges)), 1)
+    rate = float(max_rate) / workers if max_rate else None
+
+    tasks = [(reference(model), transform, version, version_field, query,
+              tenant, lower, upper, batch_size, rate,
+              "%s.%d.json" % (prefix, i))
+             for i, (lower, upper) in enumerate(ranges)]
+
+    if processes == 0:
+        results = [run_partition(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(workers, initializer=database.reconnect)
+        try:
+            results = pool.map(run_partition, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    totals = {
+        "migrated": sum(result["migrated"] for result in results),
+        "skipped": sum(result["skipped"] for result in results),
+    }
+    logger.info("Migrated %s to version %s: %d documents written, %d skipped",
+                model.__name__, version, totals["migrated"], totals["skipped"])
+    return totals
@@ -17,16 +17,34 @@ import database
 
 import inflect
 import re
+import threading
+import time
 
 from exceptions import ValidationError, InvalidSchemaException, \
     InvalidReloadException
-from pymongo import DESCENDING
+from raw import raw_fields
+from record import record_class
+from prefetch import prefetched, DEFAULT_BATCH_SIZE
+from buffer import WriteBuffer
+from scatter import scatter, sort_documents
+from view import MaterializedView
+from migration import migrate
+from profiler import current_profiler
+from constraints import compile_constraints
+from database.query import freeze
+from serialization import reference, restore
+from pymongo import ASCENDING, DESCENDING, HASHED, version_tuple
 
 from bson import ObjectId
+from collections import OrderedDict
 from copy import deepcopy
 
 inflect_engine = inflect.engine()
 
+# Most counts each model keeps for count(cache_ttl=...)
+MAX_CACHED_COUNTS = 1000
+count_cache_lock = threading.Lock()
+
 ValidTypes = {
     "integer": int,
     "boolean": bool,
@@ -36,12 +54,56 @@ ValidTypes = {
     "date": datetime
 }
 
+# Python types accepted by the scalar schema types, used to check whole arrays
+# at once
+ScalarTypes = {
+    "any": (object,),
+    "integer": (int, long, float),
+    "number": (int, long, float),
+    "boolean": (bool,),
+    "string": (basestring,),
+    "object_id": (ObjectId,),
+    "date": (datetime,),
+    "null": (type(None),),
+}
+
+
+def scalar_types(schema):
+    ''' Get the Python types a scalar schema accepts, or None if it accepts
+    arrays or objects that need checking field by field. '''
+    value_type = schema.get("type", "object")
+    if not isinstance(value_type, list):
+        value_type = [value_type]
+
+    accepted = ()
+    for subtype in value_type:
+        if subtype not in ScalarTypes:
+            return None
+        accepted += ScalarTypes[subtype]
+    return accepted
+
 
 class Model(object):
+    # Undecoded source document of a lazy model, see from_raw()
+    _raw = None
+
+    # Compiled constraint checks of the schema, see compile_schema()
+    _constraints = {}
+
+    # Write-behind buffer used by save(), see buffer_writes()
+    _write_buffer = None
+
+    # Tenant whose database holds this object, see route()
+    _tenant = None
+
     def __init__(self, fields={}, from_find=False, *args, **kwargs):
-        ''' Creates an instance of the object.'''
+        ''' Creates an instance of the object. Pass tenant=... to store it in
+        that tenant's database, see route(). '''
         self._from_find = from_find
 
+        if kwargs.get("tenant") is not None:
+            self._tenant = kwargs["tenant"]
+
         fields = deepcopy(fields)
 
         # populate any default fields for objects that haven't come from the DB
@@ -55,39 +117,119 @@ class Model(object):
 
     def reload(self):
         ''' Reload this object's data from the DB. '''
-        result = self.__class__.find_by_id(self._id)
+        result = self.__class__.find_by_id(self._id, tenant=self._tenant)
 
         # result will be None in the case that this object hasn't yet been
         # saved to the DB, or if the object has been deleted since it was
         # fetched
         if result:
+            self._raw = None
             self._fields = self.cast(result._fields)
         else:
             raise InvalidReloadException("No object in the database with ID %s" % self._id)
 
     def save(self, *args, **kwargs):
-        ''' Saves an object to the database. '''
+        ''' Saves an object to the database. If buffer_writes() has been
+        called on the model and no driver options are given, the object is
+        queued and written in the background. '''
         self.validate()
 
+        if self._write_buffer is not None and not args and not kwargs:
+            self._write_buffer.add(self)
+            return
+
         # set safe to True by default, older versions of pymongo didn't do that
         if not "safe" in kwargs:
             kwargs["safe"] = True
 
-        self._id = self.collection().save(self._fields, *args, **kwargs)
+        self._id = self._collection(self._tenant).save(self._fields, *args,
+                                                       **kwargs)
 
     def delete(self):
         ''' Removes an object from the database. '''
         if self._id:
-            self.collection().remove({"_id": ObjectId(str(self._id))})
+            self._collection(self._tenant).remove(
+                {"_id": ObjectId(str(self._id))})
 
     def get(self, field, default=None):
         ''' Get a field if it exists, otherwise return the default. '''
-        return self._fields.get(field, default)
+        if field in self._fields:
+            return self._fields[field]
+        elif self._raw is not None and field in self._raw:
+            return self._load_field(field)
+        return default
+
+    @classmethod
+    def from_raw(cls, raw, tenant=None):
+        ''' Build a lazy model around a document straight from the database.
+        `raw` may be encoded BSON, a RawBSONDocument or a dict. Fields are
+        cast and validated one at a time as they are accessed; the whole
+        document is only checked by to_dict(), save() or by changing a field.
+        '''
+        obj = cls.__new__(cls)
+        obj._from_find = True
+        obj._fields = {}
+        obj._raw = raw_fields(raw)
+        if tenant is not None:
+            obj._tenant = tenant
+        return obj
+
+    def _load_field(self, field):
+        ''' Cast and validate a single field of a lazy model. '''
+        value_schema = self._schema["properties"].get(field)
+        value = self._raw[field]
+
+        if value_schema is not None:
+            value = self.cast(value, value_schema)
+            self.validate_field(field, value_schema, value)
+
+        self._fields[field] = value
+        return value
+
+    def _materialize(self):
+        ''' Cast every remaining field of a lazy model. Returns whether there
+        was anything left, in which case the fields still need validating. '''
+        if self._raw is None:
+            return False
+
+        properties = self._schema["properties"]
+        for field, value in self._raw.items():
+            if field not in self._fields:
+                self._fields[field] = self.cast(value,
+                                                properties.get(field, {}))
+
+        self._raw = None
+        return True
+
+    @classmethod
+    def buffer_writes(cls, max_size=1000, interval=1.0, on_error=None):
+        ''' Start buffering save() calls on this model. Saves are coalesced by
+        _id and written in bulk once `max_size` are waiting, every `interval`
+        seconds, on flush() and at exit. Write errors are passed to
+        `on_error(exception, documents)`. Returns the WriteBuffer. '''
+        if cls._write_buffer is None:
+            cls._write_buffer = WriteBuffer(cls, max_size=max_size,
+                                            interval=interval,
+                                            on_error=on_error)
+        return cls._write_buffer
+
+    @classmethod
+    def stop_buffering(cls):
+        ''' Write any buffered saves and go back to saving immediately. '''
+        if cls._write_buffer is not None:
+            cls._write_buffer.close()
+            cls._write_buffer = None
+
+    @classmethod
+    def flush(cls):
+        ''' Write any buffered saves now. '''
+        if cls._write_buffer is not None:
+            cls._write_buffer.flush()
 
     @classmethod
     def bulk_create(cls, objects, *args, **kwargs):
         ''' Create a number of objects (yay performance). '''
-        docs = [obj._fields for obj in objects]
+        docs = [obj.to_dict() for obj in objects]
         return cls.collection().insert(docs)
 
     @classmethod
@@ -112,7 +254,117 @@ class Model(object):
         To get a count, use the count() function which accepts the same
         arguments as find() with the exception of non-query fields like sort,
         limit, skip.
+
+        Pass lazy=True to get models that only decode the fields you access,
+        see from_raw(). Pass readonly=True to get compact immutable records
+        instead of models; they are cast but not validated, and can't be
+        changed or saved.
+
+        Pass tenant=... to query that tenant's database, see route().
+
+        Pass prefetch=N to fetch and build the results on a background thread,
+        keeping up to N batches of batch_size results ready while you process
+        the current one.
+        '''
+        lazy = kwargs.pop("lazy", False)
+        readonly = kwargs.pop("readonly", False)
+        prefetch = kwargs.pop("prefetch", 0)
+        tenant = kwargs.pop("tenant", None)
+
+        collection = cls._collection(tenant)
+
+        hydrate = cls._hydrator(lazy=lazy, readonly=readonly, tenant=tenant)
+        results = cls._find_results(collection, hydrate, *args, **kwargs)
+
+        if prefetch:
+            results = prefetched(results, prefetch,
+                                 kwargs.get("batch_size") or DEFAULT_BATCH_SIZE)
+
+        try:
+            for obj in results:
+                yield obj
+        finally:
+            results.close()
+
+    @classmethod
+    def aggregate(cls, pipeline, output_model=None, batch_size=None,
+                  allow_disk_use=False, readonly=False, tenant=None):
+        ''' Run an aggregation pipeline on this collection. Like find(), this
+        returns a generator: results are read through the server's cursor and
+        turned into objects one at a time.
+
+        Results are cast and validated as objects of `output_model`, which is
+        this model by default. Pipelines that change the shape of the
+        documents ($group, $project) can pass another model, or the schema of
+        one; the "_id" of result schemas may be of any type unless they say
+        otherwise. Pass readonly=True to get read-only records instead.
+
+        `batch_size` sets the size of the cursor's batches and
+        `allow_disk_use` lets the server use temporary files for large sorts
+        and groups. Drivers older than pymongo 2.7 return the whole result at
+        once instead of a cursor.
         '''
+        if output_model is None:
+            output_model = cls
+        elif isinstance(output_model, dict):
+            output_model = cls._result_model(output_model)
+
+        options = {}
+        if allow_disk_use:
+            options["allowDiskUse"] = True
+        if version_tuple >= (3,):
+            if batch_size:
+                options["batchSize"] = batch_size
+        elif version_tuple >= (2, 7):
+            options["cursor"] = {"batchSize": batch_size} if batch_size else {}
+
+        hydrate = output_model._hydrator(readonly=readonly, tenant=tenant)
+        results = cls._collection(tenant).aggregate(pipeline, **options)
+
+        if isinstance(results, dict):
+            # no cursor, the results came back in one document
+            results = results["result"]
+
+        try:
+            for document in results:
+                yield hydrate(document)
+        finally:
+            if hasattr(results, "close"):
+                results.close()
+
+    @classmethod
+    def _result_model(cls, schema):
+        ''' Get the model for aggregation results matching `schema`, creating
+        it the first time. '''
+        if "_result_models" not in cls.__dict__:
+            cls._result_models = {}
+
+        key = freeze(schema)
+        model = cls._result_models.get(key)
+        if model is None:
+            # imported here, the package imports this module
+            from warmongo import model_factory
+
+            schema = dict(schema, properties=dict(schema["properties"]))
+            schema["properties"].setdefault("_id", {"type": "any"})
+            # not registered, it mustn't replace a model of the same name
+            model = cls._result_models[key] = model_factory(schema,
+                                                            register=False)
+        return model
+
+    @classmethod
+    def _hydrator(cls, lazy=False, readonly=False, tenant=None):
+        ''' Get the function that turns documents from find() into objects. '''
+        if readonly:
+            return record_class(cls).from_document
+        elif lazy:
+            return lambda obj: cls.from_raw(obj, tenant=tenant)
+        return lambda obj: cls(obj, from_find=True, tenant=tenant)
+
+    @classmethod
+    def _find_results(cls, collection, hydrate, *args, **kwargs):
+        ''' Run a find() query against `collection`, passing each document
+        through `hydrate`. '''
         options = {}
 
         for option in ["sort", "limit", "skip", "batch_size"]:
@@ -130,19 +382,22 @@ class Model(object):
             while found_something:
                 found_something = False
 
-                result = cls.collection().find(*args, **kwargs)
+                result = collection.find(*args, **kwargs)
                 result = result.skip(current_skip).limit(limit)
 
                 if "sort" in options:
                     result = result.sort(options["sort"])
 
-                for obj in result:
-                    found_something = True
-                    yield cls(obj, from_find=True)
+                try:
+                    for obj in result:
+                        found_something = True
+                        yield hydrate(obj)
+                finally:
+                    result.close()
 
                 current_skip += limit
         else:
-            result = cls.collection().find(*args, **kwargs)
+            result = collection.find(*args, **kwargs)
 
             if "sort" in options:
                 result = result.sort(options["sort"])
@@ -153,40 +408,58 @@ class Model(object):
             if "limit" in options:
                 result = result.limit(options["limit"])
 
-            for obj in result:
-                yield cls(obj, from_find=True)
+            try:
+                for obj in result:
+                    yield hydrate(obj)
+            finally:
+                result.close()
 
     @classmethod
     def find_by_id(cls, id, **kwargs):
         ''' Finds a single object from this collection. '''
+        tenant = kwargs.pop("tenant", None)
+
         if isinstance(id, basestring):
             id = ObjectId(id)
 
         args = {"_id": id}
 
-        result = cls.collection().find_one(args, **kwargs)
+        result = cls._collection(tenant).find_one(args, **kwargs)
         if result is not None:
-            return cls(result, from_find=True)
+            return cls(result, from_find=True, tenant=tenant)
         return None
 
     @classmethod
     def find_latest(cls, *args, **kwargs):
         ''' Finds the latest one by _id and returns it. '''
+        tenant = kwargs.pop("tenant", None)
         kwargs["limit"] = 1
         kwargs["sort"] = [("_id", DESCENDING)]
 
-        result = cls.collection().find(*args, **kwargs)
-
-        if result.count() > 0:
-            return cls(result[0], from_find=True)
-        return None
+        # a single limited query, rather than a count and then a fetch
+        cursor = cls._collection(tenant).find(*args, **kwargs)
+        try:
+            for result in cursor:
+                return cls(result, from_find=True, tenant=tenant)
+            return None
+        finally:
+            cursor.close()
 
     @classmethod
     def find_one(cls, *args, **kwargs):
-        ''' Finds a single object from this collection. '''
-        result = cls.collection().find_one(*args, **kwargs)
+        ''' Finds a single object from this collection. Pass lazy=True to get
+        a lazy model, see from_raw(). '''
+        tenant = kwargs.pop("tenant", None)
+
+        if kwargs.pop("lazy", False):
+            result = cls._collection(tenant).find_one(*args, **kwargs)
+            if result is not None:
+                return cls.from_raw(result, tenant=tenant)
+            return None
+
+        result = cls._collection(tenant).find_one(*args, **kwargs)
         if result is not None:
-            return cls(result)
+            return cls(result, tenant=tenant)
         return None
 
     @classmethod
@@ -194,24 +467,231 @@ class Model(object):
         ''' Counts the number of items:
             - not the same as pymongo's count, this is the equivalent to:
                 collection.find(*args, **kwargs).count()
+
+        Options:
+            - estimated=True reads the number of documents in the collection
+              from its metadata instead of counting them. No query is allowed.
+            - hint picks the index to count with.
+            - max_time limits the time the server spends counting, in seconds,
+              where the driver supports it.
+            - cache_ttl keeps the result for that many seconds and returns it
+              for the same query, see clear_count_cache().
         '''
-        return cls.collection().find(*args, **kwargs).count()
+        tenant = kwargs.pop("tenant", None)
+        estimated = kwargs.pop("estimated", False)
+        hint = kwargs.pop("hint", None)
+        max_time = kwargs.pop("max_time", None)
+        cache_ttl = kwargs.pop("cache_ttl", None)
+
+        if estimated and (any(args) or any(kwargs.values())):
+            raise ValueError("Estimated counts can't take a query")
+
+        if cache_ttl:
+            key = (tenant, estimated, freeze(list(args)), freeze(kwargs),
+                   freeze(hint))
+            cache = cls._count_cache()
+            cached = cache.get(key)
+            if cached is not None and cached[0] > time.time():
+                return cached[1]
+
+        collection = cls._collection(tenant)
+
+        if estimated:
+            if hasattr(collection, "estimated_document_count"):
+                result = collection.estimated_document_count()
+            else:
+                # without a query count() only reads the collection metadata
+                result = collection.count()
+        else:
+            cursor = collection.find(*args, **kwargs)
+            if hint is not None:
+                cursor = cursor.hint(hint)
+            if max_time is not None and hasattr(cursor, "max_time_ms"):
+                cursor = cursor.max_time_ms(int(max_time * 1000))
+            result = cursor.count()
+
+        if cache_ttl:
+            cls._cache_count(key, cache_ttl, result)
+        return result
+
+    @classmethod
+    def _count_cache(cls):
+        # each model class keeps its own counts, oldest first
+        if "_counts" not in cls.__dict__:
+            cls._counts = OrderedDict()
+        return cls._counts
+
+    @classmethod
+    def _cache_count(cls, key, ttl, result):
+        now = time.time()
+
+        with count_cache_lock:
+            cache = cls._count_cache()
+            cache.pop(key, None)
+            cache[key] = (now + ttl, result)
+
+            for stale in [stale for stale, (expires, _) in cache.items()
+                          if expires <= now]:
+                del cache[stale]
+
+            while len(cache) > MAX_CACHED_COUNTS:
+                cache.popitem(last=False)
+
+    @classmethod
+    def clear_count_cache(cls):
+        ''' Forget the counts kept by count(cache_ttl=...). '''
+        with count_cache_lock:
+            cls._counts = OrderedDict()
+
+    @classmethod
+    def migrate(cls, transform, version, query=None, **options):
+        ''' Rewrite the objects matching `query` with `transform`, in
+        parallel and resumably. See warmongo.migration.migrate() for the
+        options. '''
+        return migrate(cls, transform, version, query, **options)
+
+    @classmethod
+    def materialize(cls, query=None, interval=5.0, tenant=None, watch=True):
+        ''' Load the objects matching `query` into memory and keep them up to
+        date, following the change stream when the database has one and
+        reloading every `interval` seconds otherwise. Returns a
+        MaterializedView with find(), find_one() and count(). Call stop() on it
+        when you're done. '''
+        return MaterializedView(cls, query, interval=interval, tenant=tenant,
+                                watch=watch).start()
+
+    @classmethod
+    def scatter_find(cls, tenants, *args, **kwargs):
+        ''' Run find() against the databases of all `tenants` at the same time
+        and return a list of the results, see route(). If `sort` is given the
+        results of all tenants are merged in that order, and `skip` and
+        `limit` apply to the merged results. `workers` sets the number of
+        threads. '''
+        workers = kwargs.pop("workers", None)
+        sort = kwargs.pop("sort", None)
+        skip = kwargs.pop("skip", 0)
+        limit = kwargs.pop("limit", 0)
+
+        def fetch(tenant):
+            result = cls._collection(tenant).find(*args, **kwargs)
+
+            if sort is not None:
+                result = result.sort(sort)
+
+            if limit:
+                # every tenant could hold the first results
+                result = result.limit(skip + limit)
+
+            return [(tenant, doc) for doc in result]
+
+        found = []
+        for results in scatter(fetch, tenants, workers):
+            found.extend(results)
+
+        if sort is not None:
+            found = sort_documents(found, sort, key=lambda item: item[1])
+
+        if limit:
+            found = found[skip:skip + limit]
+        elif skip:
+            found = found[skip:]
+
+        return [cls(doc, from_find=True, tenant=tenant)
+                for tenant, doc in found]
+
+    @classmethod
+    def scatter_count(cls, tenants, *args, **kwargs):
+        ''' Count matching objects in the databases of all `tenants` at the
+        same time. Returns the total, or a dict of tenant to count if
+        `by_tenant` is True. `workers` sets the number of threads. '''
+        workers = kwargs.pop("workers", None)
+        by_tenant = kwargs.pop("by_tenant", False)
+        tenants = list(tenants)
+
+        counts = scatter(lambda tenant: cls.count(tenant=tenant, *args,
+                                                  **kwargs),
+                         tenants, workers)
+
+        if by_tenant:
+            return dict(zip(tenants, counts))
+        return sum(counts)
+
+    @classmethod
+    def _collection(cls, tenant=None):
+        ''' Call collection(), without arguments when there is no tenant so
+        that overrides of collection() not taking one keep working. '''
+        if tenant is None:
+            return cls.collection()
+        return cls.collection(tenant)
 
     @classmethod
-    def collection(cls):
+    def collection(cls, tenant=None):
         ''' Get the pymongo collection object for this model. Useful for
-        features not supported by Warmongo like aggregate queries and
-        map-reduce. '''
-        return database.get_collection(collection=cls.collection_name(),
-                                       database=cls.database_name())
+        features not supported by Warmongo like map-reduce. Pass a tenant to
+        get the collection in that tenant's database, see route(). While a
+        QueryProfiler is active the collection is wrapped so that its queries
+        are recorded. '''
+        if tenant is None:
+            database_name = cls.database_name()
+        else:
+            database_name = cls.route(tenant)
+
+        collection = database.get_collection(collection=cls.collection_name(),
+                                             database=database_name)
+
+        profiler = current_profiler()
+        if profiler is not None:
+            return profiler.wrap(collection, cls)
+        return collection
+
+    @classmethod
+    def ensure_indexes(cls, tenant=None):
+        ''' Create the indexes listed under "indexes" in the schema. Each entry
+        is either a field name or an object with a "key" (a field name or a
+        list of [field, direction] pairs), an optional "type" of "hashed" and
+        an optional "unique" flag. '''
+        collection = cls._collection(tenant)
+
+        for key, options in cls.index_specs():
+            collection.ensure_index(key, **options)
+
+    @classmethod
+    def index_specs(cls):
+        ''' Get the indexes listed in the schema as (key, options) pairs, where
+        key is a list of (field, direction). '''
+        specs = []
+
+        for index in cls._schema.get("indexes", []):
+            if isinstance(index, basestring):
+                index = {"key": index}
+
+            key = index["key"]
+            if isinstance(key, basestring):
+                direction = HASHED if index.get("type") == "hashed" else ASCENDING
+                key = [(key, direction)]
+            else:
+                key = [tuple(pair) for pair in key]
+
+            options = {}
+            if index.get("unique"):
+                options["unique"] = True
+
+            specs.append((key, options))
+
+        return specs
 
     @classmethod
     def collection_name(cls):
         ''' Get the collection associated with this class. The convention is
-        to take the lowercase of the class name and pluralize it. '''
+        to take the lowercase of the class name and pluralize it. The name is
+        worked out once per class. '''
         global inflect_engine
+        if "_collection_name" in cls.__dict__:
+            return cls._collection_name
+
         if cls._schema.get("collectionName"):
-            return cls._schema.get("collectionName")
+            cls._collection_name = cls._schema.get("collectionName")
+            return cls._collection_name
         elif cls._schema.get("name"):
             name = cls._schema.get("name")
         else:
@@ -221,7 +701,8 @@ class Model(object):
         name = (name[0] + re.sub('([A-Z])', r'_\1', name[1:])).lower()
 
         # pluralize
-        return inflect_engine.plural(name)
+        cls._collection_name = inflect_engine.plural(name)
+        return cls._collection_name
 
     @classmethod
     def database_name(cls):
@@ -231,12 +712,33 @@ class Model(object):
             return cls._schema.get("databaseName")
         return None
 
+    @classmethod
+    def route(cls, tenant):
+        ''' Get the name of the database holding the data of `tenant`. The
+        default uses the "tenantDatabaseName" format string in the schema,
+        e.g. "reports_%s"; override it in subclasses for anything fancier.
+        Databases on other hosts only need to be passed to connect(). '''
+        if cls._schema.get("tenantDatabaseName"):
+            return cls._schema.get("tenantDatabaseName") % tenant
+        return cls.database_name()
+
     def to_dict(self):
         ''' Convert the object to a dict. '''
+        if self._raw is not None:
+            self.validate()
         return self._fields
 
+    def __reduce__(self):
+        ''' Pickle the object as its model's name and its fields, so that the
+        schema isn't sent along and unpickling doesn't validate again. '''
+        if self._raw is not None:
+            self.validate()
+        return (restore, (reference(type(self)), self._fields, self._tenant,
+                          self._from_find))
+
     def validate(self):
         ''' Validate `schema` against a dict `obj`. '''
+        self._materialize()
         self.validate_field("", self._schema, self._fields)
 
     def validate_field_type(self, key, value_schema, value, value_type):
@@ -262,6 +764,14 @@ class Model(object):
         else:
             self.validate_simple(key, value_type, value)
 
+    def constraints_for(self, schema):
+        ''' Get the compiled constraint checks for `schema`. '''
+        entry = self._constraints.get(id(schema))
+        if entry is not None and entry[0] is schema:
+            return entry[1]
+        # not part of the model's schema, e.g. replaced after model_factory()
+        return compile_constraints(schema)
+
     def validate_field(self, key, value_schema, value):
         ''' Validate a single field in `value` named `key` against `value_schema`. '''
         # check the type
@@ -269,14 +779,32 @@ class Model(object):
 
         self.validate_field_type(key, value_schema, value, value_type)
 
+        # minimum, pattern, enum, etc.
+        for check in self.constraints_for(value_schema):
+            check(key, value)
+
     def validate_array(self, key, value_schema, value):
         if not isinstance(value, list):
             raise ValidationError("Field '%s' is of type 'array', received '%s' (%s)" %
                                   (key, str(value), type(value)))
 
-        if value_schema.get("items"):
+        items = value_schema.get("items")
+        if items:
+            accepted = scalar_types(items)
+
+            if accepted is not None and \
+                    all(issubclass(klass, accepted) for klass in set(map(type, value))):
+                # all of the items have a valid type, so only the constraints
+                # are left to check
+                checks = self.constraints_for(items)
+                if checks:
+                    for item in value:
+                        for check in checks:
+                            check(key, item)
+                return
+
             for item in value:
-                self.validate_field(key, value_schema["items"], item)
+                self.validate_field(key, items, item)
         else:
             # no items, this is an untyped array
             pass
@@ -328,7 +856,6 @@ class Model(object):
             if not isinstance(value, ValidTypes[value_type]):
                 raise ValidationError("Field '%s' is of type '%s', received '%s' (%s)" %
                                       (key, value_type, str(value), type(value)))
-            # TODO: check other things like maximum, etc.
         else:
             # unknown type
             raise InvalidSchemaException("Unknown type '%s'!" % value_type)
@@ -346,6 +873,15 @@ class Model(object):
                 key: self.cast(value, schema["properties"].get(key, {})) for key, value in fields.items()
             }
         elif value_type == "array" and isinstance(fields, list) and schema.get("items"):
+            if schema["items"].get("type") == "integer":
+                if any(issubclass(klass, float) for klass in set(map(type, fields))):
+                    return [int(value) if isinstance(value, float) else value
+                            for value in fields]
+                return list(fields)
+            elif scalar_types(schema["items"]) is not None:
+                # nothing to cast in arrays of other scalars
+                return list(fields)
+
             return [
                 self.cast(value, schema["items"]) for value in fields
             ]
@@ -358,10 +894,13 @@ class Model(object):
     def __getattr__(self, attr):
         ''' Get an attribute from the fields we've selected. Note that if the
         field doesn't exist, this will return None. '''
-        if attr in self._schema["properties"] and attr in self._fields:
-            return self._fields.get(attr)
-        else:
-            raise AttributeError("%s has no attribute '%s'" % (str(self), attr))
+        if attr in self._schema["properties"]:
+            if attr in self._fields:
+                return self._fields[attr]
+            elif self._raw is not None and attr in self._raw:
+                return self._load_field(attr)
+
+        raise AttributeError("%s has no attribute '%s'" % (str(self), attr))
 
     def __setattr__(self, attr, value):
         ''' Set one of the fields, with validation. Exception is on "private"
@@ -369,6 +908,9 @@ class Model(object):
         if attr.startswith("_"):
             return object.__setattr__(self, attr, value)
 
+        if self._raw is not None:
+            self.validate()
+
         if attr in self._schema["properties"]:
             # Check the field against our schema
             self.validate_field(attr, self._schema["properties"][attr], value)
@@ -0,0 +1,98 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Background iteration of query results. '''
+import Queue
+import sys
+import threading
+
+# Batch size used when find() is called with prefetch but no batch_size
+DEFAULT_BATCH_SIZE = 100
+
+# How long the background thread waits on a full queue before checking whether
+# it has been cancelled
+PUT_TIMEOUT = 0.1
+
+# Marks the end of the results
+DONE = object()
+
+
+class Failure(object):
+    ''' Wraps an exception raised on the background thread so it can be
+    re-raised in the consumer. '''
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+def prefetched(iterable, batches, batch_size=DEFAULT_BATCH_SIZE):
+    ''' Iterate over `iterable` on a background thread, keeping up to
+    `batches` batches of `batch_size` items ready for the consumer. Closing
+    the returned generator stops the background thread. '''
+    results = Queue.Queue(maxsize=batches)
+    cancelled = threading.Event()
+
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                results.put(item, timeout=PUT_TIMEOUT)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def work():
+        batch = []
+        try:
+            for item in iterable:
+                batch.append(item)
+
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+
+            if batch and not put(batch):
+                return
+            put(DONE)
+        except Exception:
+            put(Failure(sys.exc_info()))
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    worker = threading.Thread(target=work, name="warmongo-prefetch")
+    worker.daemon = True
+
+    def consume():
+        worker.start()
+        try:
+            while True:
+                batch = results.get()
+
+                if batch is DONE:
+                    return
+                elif isinstance(batch, Failure):
+                    raise batch.exc_info[0], batch.exc_info[1], \
+                        batch.exc_info[2]
+
+                for item in batch:
+                    yield item
+        finally:
+            cancelled.set()
+
+            # give a thread waiting on a full queue the chance to notice; one
+            # that is waiting on the database finishes on its own
+            worker.join(PUT_TIMEOUT * 2)
+
+    return consume()
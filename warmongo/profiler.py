@@ -0,0 +1,378 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Recording the queries models run, to find slow queries and N+1 patterns.
+'''
+import json
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+logger = logging.getLogger("warmongo.profiler")
+
+# Profilers active on each thread, innermost last
+active = threading.local()
+
+
+def current_profiler():
+    ''' Get the innermost profiler active on this thread, or None. '''
+    stack = getattr(active, "stack", None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+def query_shape(value):
+    ''' Replace the values in a query with placeholders, keeping the fields
+    and operators. Queries with the same shape differ only in their values. '''
+    if isinstance(value, dict):
+        return dict((key, query_shape(item)) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        if any(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ["?"]
+    return "?"
+
+
+def format_shape(spec):
+    return json.dumps(query_shape(spec or {}), sort_keys=True)
+
+
+def format_sort(sort):
+    if not sort:
+        return None
+    if isinstance(sort, basestring):
+        return sort
+    return ", ".join("%s %s" % (field, direction) for field, direction in sort)
+
+
+def find_index(plan):
+    ''' Find the name of the index a (modern) winning plan scans. '''
+    if not isinstance(plan, dict):
+        return None
+    if plan.get("indexName"):
+        return plan["indexName"]
+
+    stages = [plan.get("inputStage")] + list(plan.get("inputStages", []))
+    for stage in stages:
+        name = find_index(stage)
+        if name:
+            return name
+    return None
+
+
+def summarize_explain(explain):
+    ''' Pull the index used and the number of documents examined and returned
+    out of explain output. Understands both the old (MongoDB 2.x) format and
+    the queryPlanner/executionStats one. '''
+    if "queryPlanner" in explain:
+        stats = explain.get("executionStats", {})
+        return {
+            "index": find_index(explain["queryPlanner"].get("winningPlan")),
+            "keys_examined": stats.get("totalKeysExamined"),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "returned": stats.get("nReturned"),
+        }
+
+    cursor = explain.get("cursor", "")
+    index = None
+    if cursor.startswith("BtreeCursor "):
+        index = cursor.split(" ", 1)[1]
+
+    return {
+        "index": index,
+        "keys_examined": explain.get("nscanned"),
+        "docs_examined": explain.get("nscannedObjects"),
+        "returned": explain.get("n"),
+    }
+
+
+class QueryStats(object):
+    ''' What a profiler knows about queries of one shape. '''
+
+    def __init__(self, collection, operation, shape, sort):
+        self.collection = collection
+        self.operation = operation
+        self.shape = shape
+        self.sort = sort
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.slow = 0
+
+    def as_dict(self):
+        return {
+            "collection": self.collection,
+            "operation": self.operation,
+            "shape": self.shape,
+            "sort": self.sort,
+            "count": self.count,
+            "total_time": self.total_time,
+            "max_time": self.max_time,
+            "slow": self.slow,
+        }
+
+
+class QueryProfiler(object):
+    ''' Records the queries run through Model.collection() on this thread
+    while it is active:
+
+        with QueryProfiler("checkout", slow=0.05) as profiler:
+            handle_request()
+        print profiler.report()
+
+    Queries taking more than `slow` seconds are logged with their shape, sort
+    and, if `explain` is True, the server's explain summary. Queries of the
+    same shape that run `repeats` times or more in one scope are flagged as
+    probable N+1 patterns. '''
+
+    def __init__(self, name="default", slow=0.1, repeats=5, explain=True):
+        self.name = name
+        self.slow = slow
+        self.repeats = repeats
+        self.explain = explain
+
+        self.stats = OrderedDict()
+        self.slow_queries = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        stack = getattr(active, "stack", None)
+        if stack is None:
+            stack = active.stack = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, *args):
+        active.stack.remove(self)
+        if self.stats:
+            logger.info(self.report())
+
+    def wrap(self, collection, model):
+        ''' Wrap `collection` so the queries run on it are recorded. '''
+        return ProfiledCollection(collection, model, self)
+
+    def record(self, collection, operation, spec, sort, duration,
+               explain=None):
+        ''' Record one query that took `duration` seconds. `explain` is called
+        to get the server's explain output if the query was slow. '''
+        shape = format_shape(spec)
+        sort = format_sort(sort)
+        key = (collection.full_name, operation, shape, sort)
+
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = QueryStats(collection.full_name,
+                                                     operation, shape, sort)
+            stats.count += 1
+            stats.total_time += duration
+            stats.max_time = max(stats.max_time, duration)
+            repeated = stats.count == self.repeats
+
+        if repeated:
+            logger.warning("Probable N+1 query in %s: %s on %s with %s "
+                           "ran %d times", self.name, operation,
+                           collection.full_name, shape, stats.count)
+
+        if duration >= self.slow:
+            summary = None
+            if self.explain and explain is not None:
+                try:
+                    summary = summarize_explain(explain())
+                except Exception:
+                    logger.debug("Could not explain query", exc_info=True)
+
+            with self._lock:
+                stats.slow += 1
+                self.slow_queries.append({
+                    "collection": collection.full_name,
+                    "operation": operation,
+                    "shape": shape,
+                    "sort": sort,
+                    "time": duration,
+                    "explain": summary,
+                })
+
+            logger.warning("Slow query in %s: %s on %s with %s (sort: %s) "
+                           "took %.1fms; explain: %s", self.name, operation,
+                           collection.full_name, shape, sort,
+                           duration * 1000, summary)
+
+    def n_plus_one(self):
+        ''' Get the stats of the query shapes that look like N+1 patterns. '''
+        return [stats.as_dict() for stats in self.stats.values()
+                if stats.count >= self.repeats]
+
+    def summary(self):
+        ''' Get the stats of every query shape, slowest in total first. '''
+        return sorted((stats.as_dict() for stats in self.stats.values()),
+                      key=lambda stats: -stats["total_time"])
+
+    def report(self):
+        ''' Describe the queries of this scope in a few lines of text. '''
+        summary = self.summary()
+        lines = ["Queries in %s: %d run, %d distinct, %d slow, %d probable N+1" %
+                 (self.name, sum(stats["count"] for stats in summary),
+                  len(summary), len(self.slow_queries),
+                  len(self.n_plus_one()))]
+
+        for stats in summary:
+            flags = []
+            if stats["count"] >= self.repeats:
+                flags.append("N+1")
+            if stats["slow"]:
+                flags.append("%d slow" % stats["slow"])
+
+            lines.append("  %5d x %8.1fms (max %.1fms) %s %s %s%s%s" % (
+                stats["count"], stats["total_time"] * 1000,
+                stats["max_time"] * 1000, stats["operation"],
+                stats["collection"], stats["shape"],
+                " sort: %s" % stats["sort"] if stats["sort"] else "",
+                " [%s]" % ", ".join(flags) if flags else ""))
+
+        return "\n".join(lines)
+
+
+class ProfiledCollection(object):
+    ''' Collection wrapper that times find(), find_one() and count(). Anything
+    else goes straight to the collection. '''
+
+    def __init__(self, collection, model, profiler):
+        self._collection = collection
+        self._model = model
+        self._profiler = profiler
+
+    @property
+    def full_name(self):
+        return self._collection.full_name
+
+    def __getattr__(self, attr):
+        return getattr(self._collection, attr)
+
+    def with_options(self, *args, **kwargs):
+        return ProfiledCollection(self._collection.with_options(*args, **kwargs),
+                                  self._model, self._profiler)
+
+    def _explainer(self, spec, sort):
+        def explain():
+            cursor = self._collection.find(spec)
+            if sort:
+                cursor = cursor.sort(sort)
+            return cursor.explain()
+        return explain
+
+    def find(self, *args, **kwargs):
+        spec = args[0] if args else kwargs.get("spec", kwargs.get("filter"))
+        cursor = self._collection.find(*args, **kwargs)
+        return ProfiledCursor(self, cursor, spec, kwargs.get("sort"))
+
+    def find_one(self, spec_or_id=None, *args, **kwargs):
+        start = time.time()
+        result = self._collection.find_one(spec_or_id, *args, **kwargs)
+
+        if spec_or_id is not None and not isinstance(spec_or_id, dict):
+            spec_or_id = {"_id": spec_or_id}
+        self._profiler.record(self, "find_one", spec_or_id, None,
+                              time.time() - start,
+                              self._explainer(spec_or_id, None))
+        return result
+
+    def count(self):
+        start = time.time()
+        result = self._collection.count()
+        self._profiler.record(self, "count", {}, None, time.time() - start)
+        return result
+
+
+class ProfiledCursor(object):
+    ''' Cursor wrapper that adds up the time spent waiting on results and
+    records the query once it is exhausted or closed. A cursor that is just
+    dropped isn't recorded, since explaining it would mean querying from a
+    finalizer. '''
+
+    # Cursor methods returning the cursor, wrapped only if the driver's cursor
+    # has them so that hasattr() tells the truth
+    CHAINED = ("skip", "limit", "batch_size", "hint", "max_time_ms")
+
+    def __init__(self, collection, cursor, spec, sort):
+        self._collection = collection
+        self._cursor = cursor
+        self._spec = spec
+        self._sort = sort
+        self._time = 0.0
+        self._recorded = False
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+
+        value = getattr(self._cursor, attr)
+        if attr in self.CHAINED:
+            return lambda *args, **kwargs: self._chain(attr, *args, **kwargs)
+        return value
+
+    def _chain(self, method, *args, **kwargs):
+        self._cursor = getattr(self._cursor, method)(*args, **kwargs)
+        return self
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = key_or_list if direction is None else \
+            [(key_or_list, direction)]
+        return self._chain("sort", key_or_list, direction)
+
+    def _record(self, operation="find"):
+        if not self._recorded:
+            self._recorded = True
+            self._collection._profiler.record(
+                self._collection, operation, self._spec, self._sort,
+                self._time, self._collection._explainer(self._spec, self._sort))
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        start = time.time()
+        try:
+            document = next(self._cursor)
+        except StopIteration:
+            self._time += time.time() - start
+            self._record()
+            raise
+
+        self._time += time.time() - start
+        return document
+
+    __next__ = next
+
+    def __getitem__(self, index):
+        start = time.time()
+        try:
+            return self._cursor[index]
+        finally:
+            self._time += time.time() - start
+            self._record()
+
+    def count(self, *args, **kwargs):
+        start = time.time()
+        result = self._cursor.count(*args, **kwargs)
+        self._time += time.time() - start
+        self._record("count")
+        return result
+
+    def close(self):
+        self._record()
+        return self._cursor.close()
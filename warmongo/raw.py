@@ -0,0 +1,35 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Reading documents for lazy models. '''
+import bson
+
+try:
+    from bson.raw_bson import RawBSONDocument
+except ImportError:
+    RawBSONDocument = None
+
+
+def raw_fields(document):
+    ''' Get the fields of `document` as a dict. Accepts encoded BSON,
+    RawBSONDocument instances and plain dicts. Encoded documents are decoded
+    in one go by bson's C extension, which is much faster than picking fields
+    out of them in Python; lazy models only put off casting and validation. '''
+    if isinstance(document, dict):
+        return document
+    if RawBSONDocument is not None and isinstance(document, RawBSONDocument):
+        document = document.raw
+    if isinstance(document, bytes):
+        return bson.BSON(document).decode()
+    raise TypeError("Cannot read fields from %s" % type(document))
@@ -0,0 +1,142 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Compact read-only records for scanning large result sets. '''
+from exceptions import ReadOnlyException
+
+# Placeholder for fields that aren't in the document
+MISSING = object()
+
+
+def needs_cast(schema):
+    ''' Check whether Model.cast() could change a value matching `schema`. '''
+    value_type = schema.get("type", "object")
+
+    if value_type == "integer" or \
+            (isinstance(value_type, list) and "integer" in value_type):
+        return True
+    elif value_type == "object":
+        return any(needs_cast(subschema)
+                   for subschema in schema.get("properties", {}).values())
+    elif value_type == "array" and schema.get("items"):
+        return needs_cast(schema["items"])
+    return False
+
+
+class Record(tuple):
+    ''' An immutable document with one slot per schema property. Fields are
+    cast but not validated, and records can't be changed or saved. '''
+    __slots__ = ()
+
+    # Set on the classes built by record_class()
+    _field_names = ()
+    _field_indexes = {}
+    _casts = ()
+    _model = None
+
+    @classmethod
+    def from_document(cls, document):
+        ''' Build a record from a document fetched from the database. '''
+        values = []
+        for name, cast in cls._casts:
+            value = document.get(name, MISSING)
+            if cast is not None and value is not MISSING:
+                value = cast(value)
+            values.append(value)
+
+        return tuple.__new__(cls, values)
+
+    def get(self, field, default=None):
+        ''' Get a field if it exists, otherwise return the default. '''
+        index = self._field_indexes.get(field)
+        if index is None:
+            return default
+
+        value = tuple.__getitem__(self, index)
+        if value is MISSING:
+            return default
+        return value
+
+    def to_dict(self):
+        ''' Convert the record to a dict. '''
+        return dict((name, value)
+                    for name, value in zip(self._field_names, self)
+                    if value is not MISSING)
+
+    def save(self, *args, **kwargs):
+        raise ReadOnlyException("%s records are read-only" %
+                                self._model.__name__)
+
+    def delete(self):
+        raise ReadOnlyException("%s records are read-only" %
+                                self._model.__name__)
+
+    def __setattr__(self, attr, value):
+        raise ReadOnlyException("%s records are read-only" %
+                                self._model.__name__)
+
+    def __delattr__(self, attr):
+        raise ReadOnlyException("%s records are read-only" %
+                                self._model.__name__)
+
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__, self.to_dict())
+
+
+def field_property(name, index):
+    def getter(self):
+        value = tuple.__getitem__(self, index)
+        if value is MISSING:
+            raise AttributeError("%s has no attribute '%s'" %
+                                 (self.__class__.__name__, name))
+        return value
+
+    return property(getter)
+
+
+def record_class(model):
+    ''' Get the record class for `model`, building it the first time. '''
+    cached = model.__dict__.get("_record_class")
+    if cached is not None:
+        return cached
+
+    properties = model._schema["properties"]
+    names = tuple(sorted(properties.keys()))
+
+    # cast() only needs an instance for the schema, borrow an empty one
+    caster = model.__new__(model)
+    casts = []
+    for name in names:
+        if needs_cast(properties[name]):
+            casts.append((name, lambda value, schema=properties[name]:
+                          caster.cast(value, schema)))
+        else:
+            casts.append((name, None))
+
+    namespace = {
+        "__slots__": (),
+        "_field_names": names,
+        "_field_indexes": dict((name, i) for i, name in enumerate(names)),
+        "_casts": tuple(casts),
+        "_model": model,
+    }
+
+    for index, name in enumerate(names):
+        # methods win over fields with the same name, use get() for those
+        if name not in Record.__dict__ and not name.startswith("__"):
+            namespace[name] = field_property(name, index)
+
+    klass = type(str(model.__name__ + "Record"), (Record,), namespace)
+    model._record_class = klass
+    return klass
@@ -0,0 +1,178 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Models built on demand from a directory of JSON schemas. '''
+import json
+import os
+import tempfile
+import threading
+
+from warmongo import model_factory, WarmongoModel
+from exceptions import InvalidSchemaException, UnknownModelException
+
+INDEX_FILE = "index.json"
+
+
+def read_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    # write to a file of our own and rename it, so that processes writing at
+    # the same time never read or rename half a file
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, sort_keys=True)
+        os.rename(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+class SchemaRegistry(object):
+    ''' Models for the schemas in `directory`, one per .json file, built the
+    first time they are asked for:
+
+        registry = SchemaRegistry("schemas", cache_dir="/tmp/schema-cache")
+        Country = registry.Country  # or registry["Country"]
+
+    With a `cache_dir`, which file holds which model, and the model's
+    collection name, are remembered by file modification time, so startup
+    doesn't read every schema and building a model doesn't work out its
+    collection name again. '''
+
+    def __init__(self, directory, cache_dir=None, base_class=WarmongoModel):
+        self.directory = directory
+        self.cache_dir = cache_dir
+        self.base_class = base_class
+
+        self._paths = None
+        self._entries = None
+        self._models = {}
+        self._lock = threading.RLock()
+
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _cache_path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _index(self):
+        ''' Find the file of each model. '''
+        if self._paths is not None:
+            return self._paths
+
+        cached = {}
+        if self.cache_dir is not None:
+            cached = read_json(self._cache_path(INDEX_FILE)) or {}
+
+        index = {}
+        paths = {}
+        entries = {}
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".json"):
+                continue
+
+            path = os.path.join(self.directory, filename)
+            stat = os.stat(path)
+
+            entry = cached.get(filename)
+            if entry is None or entry["mtime"] != stat.st_mtime or \
+                    entry["size"] != stat.st_size:
+                with open(path) as f:
+                    name = json.load(f).get("name")
+                if not name:
+                    raise InvalidSchemaException("Schema %s has no 'name'" %
+                                                 path)
+                entry = {"mtime": stat.st_mtime, "size": stat.st_size,
+                         "name": name}
+
+            if entry["name"] in paths:
+                raise InvalidSchemaException("Model '%s' is defined in both "
+                                             "%s and %s" %
+                                             (entry["name"],
+                                              paths[entry["name"]], path))
+
+            index[filename] = entry
+            paths[entry["name"]] = path
+            entries[entry["name"]] = entry
+
+        if self.cache_dir is not None and index != cached:
+            write_json(self._cache_path(INDEX_FILE), index)
+
+        self._entries = entries
+        self._paths = paths
+        return paths
+
+    def _save_index(self):
+        index = dict((os.path.basename(self._paths[name]), entry)
+                     for name, entry in self._entries.items())
+        write_json(self._cache_path(INDEX_FILE), index)
+
+    def names(self):
+        ''' Get the names of every model in the directory. '''
+        return sorted(self._index())
+
+    def __contains__(self, name):
+        return name in self._index()
+
+    def get(self, name):
+        ''' Get the model called `name`, building it if needed. '''
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = self._build(name)
+            return self._models[name]
+
+    __getitem__ = get
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def _build(self, name):
+        try:
+            path = self._index()[name]
+        except KeyError:
+            raise UnknownModelException("No schema for model '%s' in %s" %
+                                        (name, self.directory))
+
+        # the schema was just parsed, nothing else has it
+        with open(path) as f:
+            model = model_factory(json.load(f), self.base_class, copy=False)
+
+        if self.cache_dir is not None:
+            entry = self._entries[name]
+            if "collection_name" in entry:
+                model._collection_name = entry["collection_name"]
+            else:
+                entry["collection_name"] = model.collection_name()
+                self._save_index()
+
+        return model
+
+    def preload(self):
+        ''' Build every model now, e.g. before forking workers so that they
+        share them. '''
+        for name in self.names():
+            self.get(name)
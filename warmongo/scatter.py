@@ -0,0 +1,86 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Running queries against many databases at once. '''
+from multiprocessing.pool import ThreadPool
+
+from pymongo import ASCENDING
+
+# Most threads used by a single scatter() call
+MAX_WORKERS = 16
+
+
+def scatter(func, items, workers=None):
+    ''' Call `func` on every item of `items` from a pool of threads. Returns
+    the results in the same order as `items`. '''
+    items = list(items)
+    if not items:
+        return []
+
+    if workers is None:
+        workers = min(len(items), MAX_WORKERS)
+
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def normalize_sort(sort):
+    ''' Turn a pymongo sort specification into a list of (field, direction). '''
+    if isinstance(sort, basestring):
+        return [(sort, ASCENDING)]
+    return list(sort)
+
+
+def get_path(document, path):
+    ''' Get the value at a dotted `path` in `document`, or None. '''
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+class SortKey(object):
+    ''' Orders documents the way a sort specification would. '''
+    __slots__ = ("values", "directions")
+
+    def __init__(self, document, sort):
+        self.values = [get_path(document, field) for field, _ in sort]
+        self.directions = [direction for _, direction in sort]
+
+    def __lt__(self, other):
+        for mine, theirs, direction in zip(self.values, other.values,
+                                           self.directions):
+            if mine == theirs:
+                continue
+            if direction == ASCENDING:
+                return mine < theirs
+            return mine > theirs
+        return False
+
+
+def sort_documents(documents, sort, key=None):
+    ''' Sort `documents` by a pymongo sort specification. `key` gets the
+    document out of each item if they aren't documents themselves. Since each
+    database returns its results already sorted, this is mostly merging. '''
+    sort = normalize_sort(sort)
+
+    if key is None:
+        return sorted(documents, key=lambda doc: SortKey(doc, sort))
+    return sorted(documents, key=lambda item: SortKey(key(item), sort))
@@ -0,0 +1,111 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Sending model objects between processes without their schema.
+
+Objects are pickled as the name of their model and their fields, and come back
+without being copied, cast or validated again. The receiving process needs the
+same models, created by model_factory() or registered with register(). Objects
+of models that aren't registered under their name carry their schema instead,
+and the model is built again from it. '''
+from bson import BSON
+
+from database.query import freeze
+from exceptions import UnknownModelException
+
+# Models by schema name
+models = {}
+
+# Models built from the schemas of unregistered models, see rebuild()
+rebuilt = {}
+
+
+def register(model, name=None):
+    ''' Make `model` known by `name` (its schema's name by default) to the
+    processes restoring its objects. model_factory() registers every model it
+    creates; the latest model with a name wins. '''
+    models[name or model._schema["name"]] = model
+    return model
+
+
+def lookup(name):
+    ''' Get the model registered as `name`. '''
+    try:
+        return models[name]
+    except KeyError:
+        raise UnknownModelException("No model named '%s' is registered" % name)
+
+
+def rebuild(schema):
+    ''' Get a model for `schema`, built once per process and not registered.
+    '''
+    key = freeze(schema)
+    model = rebuilt.get(key)
+    if model is None:
+        # imported here, the package imports this module
+        from warmongo import model_factory
+        model = rebuilt[key] = model_factory(schema, register=False)
+    return model
+
+
+def reference(model):
+    ''' How to refer to `model` in a serialized object: its name if it is
+    registered under it, otherwise its schema. '''
+    name = model._schema["name"]
+    if models.get(name) is model:
+        return name
+    return model._schema
+
+
+def resolve(model):
+    ''' Get the model a reference() stands for. '''
+    if isinstance(model, basestring):
+        return lookup(model)
+    elif isinstance(model, dict):
+        return rebuild(model)
+    return model
+
+
+def restore(model, fields, tenant=None, from_find=True):
+    ''' Rebuild an object of `model` (a class or a reference()) around
+    `fields`, as they are. '''
+    model = resolve(model)
+
+    obj = model.__new__(model)
+    obj._from_find = from_find
+    obj._fields = fields
+    if tenant is not None:
+        obj._tenant = tenant
+    return obj
+
+
+def dumps(obj):
+    ''' Encode a model object as BSON. Its model must be registered. '''
+    if obj._raw is not None:
+        obj.validate()
+
+    name = reference(type(obj))
+    if not isinstance(name, basestring):
+        raise UnknownModelException("Model %s is not registered" %
+                                    type(obj).__name__)
+
+    return BSON.encode({"model": name, "tenant": obj._tenant,
+                        "from_find": obj._from_find, "fields": obj._fields})
+
+
+def loads(data):
+    ''' Decode an object encoded by dumps(). '''
+    document = BSON(data).decode()
+    return restore(document["model"], document["fields"], document["tenant"],
+                   document["from_find"])
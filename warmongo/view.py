@@ -0,0 +1,180 @@
+# Copyright 2013 Rob Britton
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+''' Local copies of small collections, kept up to date in the background. '''
+import logging
+import threading
+import time
+
+from database.memory import MemoryClient
+from database.query import matches
+
+logger = logging.getLogger("warmongo")
+
+
+class MaterializedView(object):
+    ''' In-memory copy of the documents of `model` matching `query`, indexed
+    like the model's schema says.
+
+    When the database supports change streams the view follows them and is
+    only behind by the time it takes a change to arrive. Otherwise (or with
+    watch=False) it reloads the query every `interval` seconds, so it is never
+    more than `interval` seconds stale. If following the change stream fails,
+    the view reloads and tries again after `interval` seconds. '''
+
+    def __init__(self, model, query=None, interval=5.0, tenant=None,
+                 watch=True):
+        self.model = model
+        self.query = query or {}
+        self.interval = interval
+        self.tenant = tenant
+        self.watch = watch
+
+        # time of the last full load
+        self.refreshed_at = None
+
+        self._store = None
+        self._stopped = threading.Event()
+        self._worker = None
+
+    def start(self):
+        ''' Load the documents and start keeping them up to date. '''
+        source = self.model._collection(self.tenant)
+
+        if self.watch and hasattr(source, "watch"):
+            target = self._follow
+        else:
+            self.refresh()
+            target = self._poll
+
+        self._worker = threading.Thread(target=target,
+                                        name="warmongo-view-%s" %
+                                        self.model.__name__)
+        self._worker.daemon = True
+        self._worker.start()
+        return self
+
+    def stop(self):
+        ''' Stop keeping the view up to date. '''
+        self._stopped.set()
+        if self._worker is not None and \
+                self._worker is not threading.current_thread():
+            self._worker.join(self.interval)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def refresh(self):
+        ''' Reload every document from the database. '''
+        store = MemoryClient()["views"][self.model.collection_name()]
+
+        for key, options in self.model.index_specs():
+            # the database already enforces uniqueness
+            store.ensure_index(key)
+
+        for document in self.model._collection(self.tenant).find(self.query):
+            store.save(document)
+
+        # readers keep using the old copy until this one is complete
+        self._store = store
+        self.refreshed_at = time.time()
+
+    def _poll(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed to refresh view of %s",
+                                 self.model.__name__)
+
+    def _follow(self):
+        first = True
+
+        while not self._stopped.is_set():
+            try:
+                # open the stream before loading so no change is missed
+                stream = self.model._collection(self.tenant).watch(
+                    full_document="updateLookup")
+                try:
+                    self.refresh()
+                    first = False
+                    self._apply_changes(stream)
+                finally:
+                    stream.close()
+            except Exception:
+                logger.exception("Failed to follow changes of %s",
+                                 self.model.__name__)
+
+                if first:
+                    # nothing loaded yet, fall back to polling
+                    self.refresh()
+                    first = False
+
+                self._stopped.wait(self.interval)
+
+    def _apply_changes(self, stream):
+        while not self._stopped.is_set():
+            if hasattr(stream, "try_next"):
+                change = stream.try_next()
+                if change is None:
+                    self._stopped.wait(0.1)
+                    continue
+            else:
+                change = next(stream)
+
+            self.apply(change)
+
+    def apply(self, change):
+        ''' Apply a change stream event to the view. '''
+        operation = change.get("operationType")
+
+        if operation in ("insert", "update", "replace"):
+            document = change.get("fullDocument")
+            if document is not None and matches(document, self.query):
+                self._store.save(document)
+            else:
+                self._store.remove({"_id": change["documentKey"]["_id"]})
+        elif operation == "delete":
+            self._store.remove({"_id": change["documentKey"]["_id"]})
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            raise RuntimeError("Change stream of %s ended by %s" %
+                               (self.model.__name__, operation))
+
+    def _documents(self):
+        if self._store is None:
+            self.refresh()
+        return self._store
+
+    def find(self, *args, **kwargs):
+        ''' Like Model.find(), but answered from memory. Accepts the same
+        sort, skip, limit, lazy and readonly options. '''
+        hydrate = self.model._hydrator(lazy=kwargs.pop("lazy", False),
+                                       readonly=kwargs.pop("readonly", False),
+                                       tenant=self.tenant)
+
+        for document in self._documents().find(*args, **kwargs):
+            yield hydrate(document)
+
+    def find_one(self, *args, **kwargs):
+        ''' Like Model.find_one(), but answered from memory. '''
+        for obj in self.find(limit=1, *args, **kwargs):
+            return obj
+        return None
+
+    def count(self, *args, **kwargs):
+        ''' Count matching documents in the view. '''
+        return self._documents().find(*args, **kwargs).count()